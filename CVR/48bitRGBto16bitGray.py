@@ -7,7 +7,10 @@ Flattens all 48-bit RGB tiffs in a directory, and saves them in a new folder
 Saved as 16-bit tifs
 
 Functions:
-flatten48bitimages : flattens all 16-bit RGB (48bit) images in a folder.
+flatten48bitimages : flattens all 16-bit RGB (48bit) images in a folder
+    (each image with hambits.images.flattenfile).
+readmanifest, writemanifest : read/save list of converted files.
+mynewfolder : makes folder for flattened images.
 
 2016Dec21: Modified to try to be more system-independent by using os.path.join:
 UPDATED VERSION NOT TESTED YET.
@@ -17,22 +20,64 @@ UPDATED VERSION NOT TESTED YET.
 import numpy as np
 import skimage.external.tifffile as tifmod
 
-import os
+import os, sys
 import time
 import glob
+import json
+from concurrent.futures import ProcessPoolExecutor
+lib_path = os.path.abspath('..')
+sys.path.append(lib_path)
+import hambits.images as hi
+
+
+# Name of file in folder of flattened images listing converted files.
+manifestname = 'flattened_manifest.json'
+
+
+def readmanifest(manifestfile):
+    """
+    Read manifest of converted files (dict of new file name: source file
+    name); returns empty dict if there is no manifest.
+    """
+    try:
+        with open(manifestfile, 'r') as myfile:
+            return json.load(myfile)
+    except (OSError, ValueError):
+        return {}
+
+
+def writemanifest(manifestfile, manifest):
+    """
+    Save manifest of converted files (replacing old one in one step, so an
+    interruption does not leave a partly written manifest).
+    """
+    with open(manifestfile + '.tmp', 'w') as myfile:
+        json.dump(manifest, myfile, indent=0)
+    os.replace(manifestfile + '.tmp', manifestfile)
 
 
 def flatten48bitimages(mydirname, **kwargs):
     """
     Convert all 48-bit RGB tiffs to 16-bit grayscale tifs. Averages three color
-    channels, and saves in file.
-    
+    channels, and saves in file. Files are converted one at a time, or (if
+    nprocs is not 1) in parallel in separate processes, so reading, converting
+    and writing of different files overlap.
+
     params
     -------
     mydirname: string
         name of directory containing images
     kwargs: 
-        myextension: string extension (currently only handles tif or tiff)
+        extension: string extension (currently only handles tif or tiff)
+        nprocs: number of processes to use (default None: number of CPUs;
+            1: files are converted one at a time in this process). Worker
+            processes run hambits.images.flattenfile, so they can import it
+            even if this file is exec-ed into an interactive console.
+        incremental: if True, reuse existing 'flattened' folder, and skip
+            files that are listed in its manifest and whose flattened image
+            exists and is newer than the source (default False).
+        ifexists: what to do if 'flattened' folder exists and incremental is
+            False; see mynewfolder (default 'ask').
 
     returns
     ------
@@ -42,7 +87,14 @@ def flatten48bitimages(mydirname, **kwargs):
     if (kwargs.get('extension') is None):
         myextension = 'tiff'
     else:
-        myextension = '.' + kwargs.get('extension')
+        myextension = kwargs.get('extension').lstrip('.')
+    nprocs = kwargs.get('nprocs')
+    incremental = kwargs.get('incremental', False)
+    # In incremental mode, an existing 'flattened' folder is reused.
+    if incremental:
+        ifexists = 'reuse'
+    else:
+        ifexists = kwargs.get('ifexists', 'ask')
 
     # Create generic pathname for images
     mypathname = mydirname + '*.' + myextension
@@ -52,16 +104,18 @@ def flatten48bitimages(mydirname, **kwargs):
     # and flatten and save images.
     if len(myfilelist)>0:
         # create a new folder in path and return its name
-        newfoldername = mynewfolder(mydirname, 'flattened', maxk=10)
+        newfoldername = mynewfolder(mydirname, 'flattened', maxk=10,
+                                    ifexists=ifexists)
         if len(newfoldername)>0:
             # decide how much padding to add to names.
             paddinglength = len(str(len(myfilelist)))
-            # Run through each image: create new name, flatten channels, and
-            # save with new name.
-            for k in range(len(myfilelist)):
-                # Get image
-                currentfile = myfilelist[k]
-                currentimage = tifmod.imread(myfilelist[k])
+            # Files already converted (from manifest in new folder)
+            manifestfile = os.path.join(mydirname, newfoldername,
+                                        manifestname)
+            manifest = readmanifest(manifestfile)
+            # Make list of (file, new file path) for each image.
+            jobs = []
+            for currentfile in myfilelist:
                 # get file modification date (SEE os module notes about
                 # st_*time: st_ctime seems to give time when file was copied, 
                 # not when first created).
@@ -72,36 +126,50 @@ def flatten48bitimages(mydirname, **kwargs):
                                         len(myextension)+1)].zfill(
                                         paddinglength) + "_" + str(
                                         round(filedate)) + ".tif"
-                # check if image reads as numpy.ndarray and has correct type 
-                # (16 bit) and shape (3 channels).
-                if type(currentimage) is numpy.ndarray:
-                    if (currentimage.dtype == 'uint16') and (
-                            currentimage.ndim == 3):
-                        # Flatten color channels to 16-bit
-                        currentimage = np.mean(
-                            currentimage, 2).astype(np.uint16)
-                        # For the life of me, I can't get this module to save
-                        # metadata as it claims it will. Just saving in
-                        # description.
-                        tifmod.imsave(os.path.join(mydirname, newfoldername,
-                                      newfilename), currentimage,
-                                      description=currentfile)
+                newfilepath = os.path.join(mydirname, newfoldername,
+                                           newfilename)
+                # New file name includes source modification time, so a
+                # changed source gets a new name; skip files that finished
+                # (in manifest) and were not changed after conversion.
+                if incremental and (newfilename in manifest) and (
+                        os.path.exists(newfilepath)) and (
+                        os.stat(newfilepath).st_mtime >= filedate):
+                    continue
+                jobs.append((currentfile, newfilepath))
+            if incremental:
+                print(str(len(myfilelist) - len(jobs)) + ' files already ' +
+                      'converted; converting ' + str(len(jobs)))
+            # Flatten and save images; record each finished file in manifest
+            # as it completes, so an interrupted run can be resumed.
+            if nprocs == 1:
+                messages = map(hi.flattenfile, jobs)
+            else:
+                executor = ProcessPoolExecutor(max_workers=nprocs)
+                messages = executor.map(hi.flattenfile, jobs)
+            try:
+                for (currentfile, newfilepath), message in zip(jobs,
+                                                               messages):
+                    if message is None:
+                        manifest[os.path.basename(newfilepath)] = (
+                            os.path.basename(currentfile))
+                        writemanifest(manifestfile, manifest)
                     else:
-                        print(currentfile + ' is not of the right type.')
-                        
-                else:
-                        print(currentfile + ' not read.')
+                        print(message)
+            finally:
+                if nprocs != 1:
+                    executor.shutdown()
         else:
             print('Folder not made, so new images not saved')
     else:
         print('No files with correct extension found.')
 
 
-def mynewfolder(mydirname, mynewfolder, maxk = 10):
+def mynewfolder(mydirname, mynewfolder, maxk = 10, ifexists='ask'):
     """
     Create a new directory in path 'mydirname. with name 'mynewfolder'. If 
     folder with name 'mynewfolder' already exists in 'mydirname', it asks to
     create a new one, incrementing from 0 to maxk; stops if it reaches maxk.
+    With ifexists other than 'ask', does not ask for user input.
     
     Parameters:
     ----------
@@ -110,25 +178,39 @@ def mynewfolder(mydirname, mynewfolder, maxk = 10):
     mynewfolder : string
         valid folder name
     maxk : int
+    ifexists : string
+        What to do if folder already exists: 'ask' (ask user whether to make
+        new folder), 'reuse' (use existing folder), 'increment' (make new
+        folder without asking), or 'fail' (do not make folder).
     
     Returns:
     ---------
     new folder name after incrementing (empty list - [] - if cannot create
     folder.)
     """
+    if ifexists not in ('ask', 'reuse', 'increment', 'fail'):
+        raise ValueError('ifexists must be ask, reuse, increment, or fail')
     if os.path.exists(os.path.join(mydirname, mynewfolder)):
+        if ifexists == 'reuse':
+            return mynewfolder
+        elif ifexists == 'fail':
+            print(mynewfolder + ' already exists in this directory.')
+            return []
         for k in range(maxk):
             if not os.path.exists(os.path.join(mydirname, mynewfolder, 
                                                str(k))):
                 print(mynewfolder + ' already exists in this directory.')
-                response = input(
-                    'Make new folder ' + os.path.join(mynewfolder, str(k)) +
-                    '? y/n')
-                if response is 'y' or response is 'Y':
+                if ifexists == 'increment':
+                    response = 'y'
+                else:
+                    response = input(
+                        'Make new folder ' + os.path.join(mynewfolder, str(k))
+                        + '? y/n')
+                if response in ('y', 'Y'):
                     mynewfolder = os.path.join(mynewfolder, str(k))
                     os.mkdir(os.path.join(mydirname, mynewfolder))
                     break
-                elif response is 'n' or response is 'N':
+                elif response in ('n', 'N'):
                     mynewfolder = []
                     break
                 else:
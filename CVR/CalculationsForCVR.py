@@ -72,6 +72,7 @@ lib_path = os.path.abspath('..')
 sys.path.append(lib_path)
 import hambits.utils as hu
 import hambits.stats as hs
+import hambits.cache as hc
 
 DirectoryName = 'CellVolumeRegulation_Processed'
 
@@ -101,7 +102,28 @@ CleaverTransitions = {'rib07': 2, 'rib08': 2, 'rib09': 2, 'rib10': 2,
 myparams = {'tou': 1/60, 'ipu': 1, 'tmax': 60, 'ntcs': 2}
 
 
-def cvrsummarydata(stagefiles, stagetransitions, params):
+# Summary values calculated for each file (in order of columns in output).
+summarycols = ['MinVolRatio', 'TimeConstEst', 'RecoveredFraction',
+               'TimeOfMinVol', 'MinDelay', 'TimeToCutoff']
+
+# Descriptions of summary values for which CIs are calculated, and how.
+descriptions = {'RecoveredFraction': {'about':
+                                      '(V(tmax)-min(V))/(V(initial)-min(V))',
+                                      'ci method': 'T', 'ci interval': 0.95},
+                'MinVolRatio': {'about': 'min(V)/V(initial)',
+                                'ci method': 'T', 'ci interval': 0.95},
+                'TimeConstEst': {'about':
+                                 'Upper bound on time constant for shrinkage',
+                                 'ci method': 'Bernoulli', 'ci interval': 0.95
+                                 },
+                'TimeToCutoff': {'About':
+                                 'Time when V reached cutoff',
+                                 'ci method': 'Bernoulli', 'ci interval': 0.95
+                                 }}
+
+
+def cvrsummarydata(stagefiles, stagetransitions, params,
+                   volumecolumn='Volume'):
     """
     Calculate summary values for all files named in 'stage'
 
@@ -110,13 +132,16 @@ def cvrsummarydata(stagefiles, stagetransitions, params):
     stagefiles : dict
         each value is name of file; each file must be in working directory and
         be a csv with columns including 'Time', 'Image', 'ImGroup', 'blobID',
-        'Media', and 'Volume'; all contain numeric datatypes.
+        'Media', and volumecolumn; all contain numeric datatypes.
     stagetransitions : dict
         each value is the last image name before the treatment/media transition
     timeparams : dict
         Dict of constants for time conversions: 'tou' time values in column
         'Time' to desired units, ipu : images per time unit, 'tmax' : how many
         units forward to calculate, 'ntcs' : number of time constants.
+    volumecolumn : string
+        column of volumes to use (e.g. 'Volume_<model name>' column from
+        HamSequence with volumemodels)
 
     Returns
     -------
@@ -131,20 +156,332 @@ def cvrsummarydata(stagefiles, stagetransitions, params):
         TimeToCutoff : Time after media change at which volume crosses
             cutoff (cutoff = 1-e^(-ntcs); ntcs = number of time constants))
     """
-    filekeys = sorted(stagefiles.keys())
-    nkeys = len(filekeys)
-    for k in range(0, nkeys):
-        summarydict = summarize(stagefiles[filekeys[k]],
-                                stagetransitions[filekeys[k]],
-                                params)
-        if k == 0:
-            summarydf = pandas.DataFrame(index=range(0, nkeys),
-                                         columns=summarydict.keys())
-        for key in sorted(summarydict.keys()):
-            summarydf.loc[k, key] = summarydict[key]
-                        
-
-    return summarydf
+    ribbons = loadribbons(stagefiles, params, volumecolumns=[volumecolumn])
+    return summarizeribbons(ribbons, stagetransitions, params, volumecolumn)
+
+
+def loadribbons(stagefiles, params, volumecolumns=('Volume',)):
+    """
+    Read all files named in stagefiles into one long-format data frame of
+    mean values per image (time point). Reading (the slow part) only needs
+    to be done once; use summarizeribbons to calculate summary values from
+    the result (e.g. for different values of 'ntcs' or 'tmax').
+
+    Parameters :
+    ------------
+    stagefiles : dict
+        each value is name of a csv file with columns including 'Time',
+        'Image', 'ImGroup', 'Media', and volumecolumns; all with numeric
+        datatypes.
+    params : dict
+        Dict of constants for conversions; only 'tou' (time values in column
+        'Time' to desired units) is used.
+    volumecolumns : list of strings
+        volume columns to read (e.g. 'Volume_<model name>' columns from
+        HamSequence with volumemodels, to compare volume models with one
+        read; summarize each with the volumecolumn argument of
+        summarizeribbons or cvrsweep)
+
+    Returns
+    -------
+    Data frame with columns 'FileKey' (key in stagefiles), 'FileName', 'Time'
+    (converted by 'tou'), 'Image', 'Media', 'ImGroup', and volumecolumns; one
+    row per time point in each file, sorted by FileKey and Time.
+    """
+    metadatacols = ['Image', 'Media', 'ImGroup']
+    parts = []
+    for filekey in sorted(stagefiles.keys()):
+        curfile = stagefiles[filekey]
+        # Assumes all columns are numeric.
+        # Parsed files are cached (see hambits.cache).
+        curdata = hc.loadcsv(
+            curfile, usecols=metadatacols + ['Time'] + list(volumecolumns))
+        curdata['Time'] = curdata['Time'].values*params['tou']
+        grpd = curdata.groupby('Time')
+        # Check that only one value per group for metadata
+        if np.any(grpd[metadatacols].max().values -
+                  grpd[metadatacols].min().values):
+            print(curfile)
+            print(curdata[metadatacols])
+            raise SystemExit(
+                'Metadata column(s) with multiple values in a group')
+        grpd = grpd.mean().reset_index()
+        grpd.insert(0, 'FileName', curfile)
+        grpd.insert(0, 'FileKey', filekey)
+        parts.append(grpd)
+    return pandas.concat(parts, ignore_index=True)
+
+
+def summarizeribbons(ribbons, stagetransitions, params,
+                     volumecolumn='Volume'):
+    """
+    Calculate summary values for every file in ribbons (from loadribbons),
+    with grouped operations over all files at once.
+
+    Parameters :
+    ------------
+    ribbons : data frame
+        long-format data frame from loadribbons
+    stagetransitions : dict
+        keys are 'FileKey' values in ribbons; each value is the last image
+        name before the treatment/media transition
+    params : dict
+        Dict of constants for conversions: ipu : images per time unit,
+        'tmax' : how many units forward to calculate; 'ntcs' : number of time
+        constants ('tou' was already applied by loadribbons)
+    volumecolumn : string
+        column of ribbons with volumes to use (one of volumecolumns of
+        loadribbons)
+
+    Returns
+    -------
+    Data frame (one row per file, float columns except FileName) with columns:
+        FileName, MinVolRatio, TimeConstEst, RecoveredFraction, TimeOfMinVol,
+        MinDelay, TimeToCutoff (see cvrsummarydata)
+    """
+    summarydf = cvrsweep(ribbons, stagetransitions, [params['ntcs']],
+                         [params['tmax']], [params['ipu']], volumecolumn)
+    return summarydf[['FileName'] + summarycols].reset_index(drop=True)
+
+
+def prepareribbons(ribbons, stagetransitions, volumecolumn='Volume'):
+    """
+    Calculate values for every file in ribbons (from loadribbons) that do not
+    depend on 'ntcs', 'tmax' or 'ipu', and the time/volume series of the
+    final image group in each file. Used by cvrsweep.
+
+    Parameters :
+    ------------
+    ribbons : data frame
+        long-format data frame from loadribbons
+    stagetransitions : dict
+        keys are 'FileKey' values in ribbons; each value is the last image
+        name before the treatment/media transition
+    volumecolumn : string
+        column of ribbons with volumes to use
+
+    Returns
+    -------
+    base : data frame
+        indexed by FileKey (sorted), with columns FileName, TTransition
+        (time of transition image), InitialVol, MinVol, TimeOfMinVol,
+        MinDelay
+    series : dict
+        FileKey : (times, volumes) of final image group, sorted by time
+    """
+    filekeys = ribbons['FileKey']
+    filenames = ribbons.groupby('FileKey', sort=True)['FileName'].first()
+
+    # Check that there are two media values in each file
+    nmedia = ribbons.groupby('FileKey')['Media'].nunique()
+    if np.any(nmedia != 2):
+        badfile = nmedia.index[nmedia != 2][0]
+        print(filenames[badfile])
+        print("Media values: ", set(ribbons.loc[filekeys == badfile, 'Media']))
+        raise SystemExit("Wrong number of values in column 'Media'")
+
+    # Rows in first treatment (initial), and rows in last image group (final;
+    # want to use only last image group because comparison seems better if
+    # use same embryos within treatment 2).
+    grouped = ribbons.groupby('FileKey')
+    isinitial = (ribbons['Media'].values ==
+                 grouped['Media'].transform('min').values)
+    isfinal = (ribbons['ImGroup'].values ==
+               grouped['ImGroup'].transform('max').values)
+    initialdf = ribbons[isinitial]
+    finaldf = ribbons[isfinal]
+
+    # Calculate time when media changed (must be exactly one image in first
+    # media per file with the transition image name).
+    transitionimages = filekeys.map(stagetransitions).values
+    transitiondf = ribbons[isinitial & (ribbons['Image'].values ==
+                                        transitionimages)]
+    ntransition = transitiondf.groupby('FileKey').size().reindex(
+        filenames.index, fill_value=0)
+    if np.any(ntransition != 1):
+        badfile = ntransition.index[ntransition != 1][0]
+        print(filenames[badfile])
+        raise SystemExit('Transition image not found once in first media')
+    ttransition = transitiondf.set_index('FileKey')['Time']
+
+    # Initial volume (for embryos in first media/treatment)
+    initialvol = initialdf.groupby('FileKey')[volumecolumn].mean()
+
+    # Find minimum volume and time of minimum volume
+    finalgrouped = finaldf.groupby('FileKey')
+    minrows = finaldf.loc[finalgrouped[volumecolumn].idxmin()].set_index(
+        'FileKey')
+
+    # Calculate time between first usable frame in second media & transition
+    # time
+    mindelay = finalgrouped['Time'].min() - ttransition
+
+    base = pandas.DataFrame({'FileName': filenames,
+                             'TTransition': ttransition,
+                             'InitialVol': initialvol,
+                             'MinVol': minrows[volumecolumn],
+                             'TimeOfMinVol': minrows['Time'] - ttransition,
+                             'MinDelay': mindelay}, index=filenames.index)
+    series = {filekey: (group['Time'].values, group[volumecolumn].values)
+              for filekey, group in finalgrouped}
+    return base, series
+
+
+def cvrsweep(ribbons, stagetransitions, ntcsgrid, tmaxgrid, ipugrid,
+             volumecolumn='Volume'):
+    """
+    Calculate summary values for every file in ribbons (from loadribbons) for
+    every combination of values of 'ntcs', 'tmax' and 'ipu'. Values that do
+    not depend on these are calculated once (prepareribbons); each file's
+    series is then evaluated for all values in the grid at once.
+
+    Parameters :
+    ------------
+    ribbons : data frame
+        long-format data frame from loadribbons
+    stagetransitions : dict
+        keys are 'FileKey' values in ribbons; each value is the last image
+        name before the treatment/media transition
+    ntcsgrid, tmaxgrid, ipugrid : array-like
+        values of 'ntcs' (number of time constants), 'tmax' (how many units
+        forward to calculate), and 'ipu' (images per time unit) to use
+    volumecolumn : string
+        column of ribbons with volumes to use (one of volumecolumns of
+        loadribbons)
+
+    Returns
+    -------
+    Data frame with one row per file and combination of ntcs, tmax and ipu,
+    with columns FileKey, FileName, ntcs, tmax, ipu, and summary values
+    (see cvrsummarydata).
+    """
+    ntcsgrid = np.asarray(ntcsgrid, dtype=float).ravel()
+    tmaxgrid = np.asarray(tmaxgrid, dtype=float).ravel()
+    ipugrid = np.asarray(ipugrid, dtype=float).ravel()
+    base, series = prepareribbons(ribbons, stagetransitions, volumecolumn)
+    nfiles = len(base)
+
+    # Arrays with dims (file, ntcs) and (file, tmax, ipu)
+    tcross = np.full((nfiles, len(ntcsgrid)), np.nan)
+    endvol = np.full((nfiles, len(tmaxgrid), len(ipugrid)), np.nan)
+    vollost = (base['InitialVol'] - base['MinVol']).values
+    for k, filekey in enumerate(base.index):
+        times, volumes = series[filekey]
+        ttransition = base['TTransition'].values[k]
+        initialvol = base['InitialVol'].values[k]
+
+        # Calculate time when volume passes cutoff (for upper bound on time
+        # constant for volume loss). ttransition is time of last image in
+        # media 0. tcross is the time first image in which embryos have lost
+        # >= 1-e^(-ntcs) of the maximum volume lost: first image where the
+        # running minimum of volume is < cutoffvol.
+        cutoffvol = initialvol - vollost[k]*(1 - np.exp(-ntcsgrid))
+        runningmin = np.minimum.accumulate(volumes)
+        crossind = np.searchsorted(-runningmin, -cutoffvol, side='right')
+        crossed = crossind < len(times)
+        tcross[k, crossed] = times[crossind[crossed]] - ttransition
+
+        # Volume in image nearest to time tmax after transition, if within
+        # ipu/2 of it (all tmax and ipu values in one call).
+        tendinds = findnearest(times, ttransition + tmaxgrid[:, None],
+                               ipugrid[None, :]/2)
+        found = ~np.isnan(tendinds)
+        endvol[k][found] = volumes[tendinds[found].astype(int)]
+
+    # Broadcast to dims (file, ntcs, tmax, ipu)
+    shape = (nfiles, len(ntcsgrid), len(tmaxgrid), len(ipugrid))
+    fileinds = np.broadcast_to(np.arange(nfiles)[:, None, None, None], shape)
+    tcross = np.broadcast_to(tcross[:, :, None, None], shape)
+    endvol = np.broadcast_to(endvol[:, None, :, :], shape)
+    minvol = base['MinVol'].values[fileinds]
+    initialvol = base['InitialVol'].values[fileinds]
+    ntcs = np.broadcast_to(ntcsgrid[None, :, None, None], shape)
+
+    sweepdf = pandas.DataFrame({
+        'FileKey': base.index.values[fileinds].ravel(),
+        'FileName': base['FileName'].values[fileinds].ravel(),
+        'ntcs': ntcs.ravel(),
+        'tmax': np.broadcast_to(tmaxgrid[None, None, :, None], shape).ravel(),
+        'ipu': np.broadcast_to(ipugrid[None, None, None, :], shape).ravel(),
+        # Minimum relative volume
+        'MinVolRatio': (minvol/initialvol).ravel(),
+        # tcub is upperbound on time constant
+        'TimeConstEst': (tcross/ntcs).ravel(),
+        # Fraction of volume regained
+        'RecoveredFraction': ((endvol - minvol)/vollost[fileinds]).ravel(),
+        'TimeOfMinVol': base['TimeOfMinVol'].values[fileinds].ravel(),
+        'MinDelay': base['MinDelay'].values[fileinds].ravel(),
+        'TimeToCutoff': tcross.ravel()})
+    return sweepdf
+
+
+def summarycis(summarydf, descriptions=descriptions, groupby=None):
+    """
+    Calculate confidence intervals (hambits.stats.cittable or cibtable, as
+    given in descriptions) of summary values, for all summary values (and
+    groups) together.
+
+    Parameters :
+    ------------
+    summarydf : data frame
+        output of cvrsummarydata or cvrsweep
+    descriptions : dict
+        keys are summary value column names; each value is a dict with
+        'ci method' ('T' or 'Bernoulli') and 'ci interval'
+    groupby : None, or column name(s) in summarydf
+        calculate confidence intervals separately for each group
+
+    Returns
+    -------
+    Data frame with one row per summary value (and group), with columns:
+    group columns (if any), Value (name of summary value), Method, Interval,
+    N, Center ('mean' for 'T', 'median' for 'Bernoulli'), LB, UB.
+    """
+    if groupby is None:
+        groupcols = []
+    elif isinstance(groupby, str):
+        groupcols = [groupby]
+    else:
+        groupcols = list(groupby)
+    # Columns using same method and interval are done together.
+    methods = {}
+    for key in descriptions:
+        methods.setdefault((descriptions[key]['ci method'],
+                            descriptions[key]['ci interval']), []).append(key)
+    parts = []
+    for (method, interval), keys in sorted(methods.items()):
+        if method == 'T':
+            citable = hs.cittable(summarydf, interval, groupby=groupby,
+                                  columns=keys)
+            citable = citable.rename(columns={'mean': 'Center'})
+        elif method == 'Bernoulli':
+            citable = hs.cibtable(summarydf, interval, groupby=groupby,
+                                  columns=keys)
+            citable = citable.rename(columns={'median': 'Center'})
+        else:
+            raise SystemExit('Unknown ci method for ' + ', '.join(keys))
+        citable['Method'] = method
+        citable['Interval'] = interval
+        parts.append(citable.rename(columns={'Column': 'Value'}))
+    cidf = pandas.concat(parts, ignore_index=True)
+    cidf = cidf.sort_values(groupcols + ['Value']).reset_index(drop=True)
+    return cidf[groupcols + ['Value', 'Method', 'Interval', 'N', 'Center',
+                             'LB', 'UB']]
+
+
+def sweepcis(sweepdf, descriptions=descriptions):
+    """
+    Calculate confidence intervals (see summarycis) of summary values for
+    each combination of ntcs, tmax and ipu in sweepdf (from cvrsweep).
+
+    Returns
+    -------
+    Data frame with one row per combination of ntcs, tmax, ipu and summary
+    value, with columns ntcs, tmax, ipu, Value (name of summary value),
+    Method, Interval, N, Center ('mean' for 'T', 'median' for 'Bernoulli'),
+    LB, UB.
+    """
+    return summarycis(sweepdf, descriptions, groupby=['ntcs', 'tmax', 'ipu'])
 
 
 def summarize(curfile, transitionimage, params):
@@ -166,7 +503,7 @@ def summarize(curfile, transitionimage, params):
 
     Returns
     -------
-    Data frame with columns :
+    Dict with keys :
         FileName
         TimeConstUpper : upper bound on time constant
         VolRatio : min volume/max volume
@@ -177,145 +514,100 @@ def summarize(curfile, transitionimage, params):
         TimeToCutoff : Time after media change at which volume crosses
             cutoff (cutoff = 1-e^(-ntcs); ntcs = number of time constants)
     """
-    metadatacols = ['Image', 'Media', 'ImGroup']
-
-    # Assumes all columns are numeric.
-    curdata = pandas.read_csv(curfile)
-    curdata['Time'] = curdata['Time'].values*params['tou']
-    grpd = curdata[metadatacols+['Time', 'Volume']].groupby(curdata['Time'])
-    # Check that only one value per group for metadata
-    if np.any(grpd[metadatacols].max().values-grpd[metadatacols].min().values):
-        print(curfile)
-        print(curdata[metadatacols])
-        raise SystemExit('Metadata column(s) with multiple values in a group')
-    else:
-        grpd = grpd.mean()
-        mediavals = set(grpd['Media'].values)
-        if len(mediavals) != 2:
-            print(curfile)
-            print("Media values: ", mediavals)
-            raise SystemExit("Wrong number of values in column 'Media'")
-        else:
-            # Split df into set in first treatment, and set in last image group
-            # (want to use only last image group because comparison seems
-            # better if use same embryos within treatment 2).
-            initialdf = grpd[grpd['Media'] == min(mediavals)]
-            finaldf = grpd[grpd['ImGroup'] == max(grpd['ImGroup'].values)]
-
-            # Calculate time when media changed.
-            ttransition = float(initialdf[initialdf['Image'] == transitionimage
-                                          ].index.values)
-
-            # Find minimum volume and time of minimum volume
-            volumes = finaldf['Volume'].values
-            times = finaldf['Time'].values
-            indmin = np.argmin(volumes)
-            minvol = volumes[indmin]
-            tofmin = times[indmin] - ttransition
-
-            # Initial volume (for embryos in first media/treatment)
-            initialvol = initialdf['Volume'].mean()
-            # Maximum volume lost
-            vollost = initialvol - minvol
-
-            # Calculate upper bound on time constant for volume loss based on
-            # time when volume passes cutoff.
-            # ttransition is time of last image in media 0. tcross is the time
-            # first image in which embryos have lost >= 1-e^(-ntcs) of the
-            # maximum volume lost.
-            cutoffvol = initialvol - vollost*(1 - np.exp(-params['ntcs']))
-            # tcross is between transition and frame that passes cutoffvol.
-            tcross = min(times[volumes < cutoffvol])-ttransition
-
-            # tcub is upperbound on time constant
-            tcub = tcross/params['ntcs']
-
-            # Calculate minimum relative volume
-            minrelvol = minvol/initialvol
-
-            # Calculate fraction of volume regained.
-            tend = ttransition + params['tmax']
-            tendind = findnearest(times, tend,
-                                  params['ipu']/2)
-            # find volume at tendind
-            if np.isnan(tendind):
-                recfraction = np.nan
-            else:
-                endvol = volumes[tendind]
-                recfraction = (endvol - minvol)/vollost
-
-            # Calculate time between first usable frame in second media &
-            # transition time
-            mindelay = min(times)-ttransition
-            return {'FileName': curfile, 'MinVolRatio': minrelvol,
-                    'TimeConstEst': tcub, 'RecoveredFraction': recfraction,
-                    'TimeOfMinVol': tofmin, 'MinDelay': mindelay,
-                    'TimeToCutoff': tcross}
+    summarydf = cvrsummarydata({curfile: curfile}, {curfile: transitionimage},
+                               params)
+    return summarydf.iloc[0].to_dict()
 
 
 def findnearest(myarray, target, bounds):
     """
     Find index of element closest to target, that is also within +/- bounds of
-    target.
-    This function may be slow for sorted arrays.
-    """
-    newarray = abs(myarray - target)
-    candidate = np.argmin(newarray)
-    if newarray[candidate] < bounds:
-        return candidate
-    else:
-        return np.nan
-
+    target (strictly less than bounds from target). Uses binary search, so is
+    fast for sorted arrays (unsorted arrays are sorted first). If several
+    elements are equally close, returns the first in myarray.
 
-# Generate path to files.
-for item in [ZygoteFiles, CleaverFiles]:
-    for key in item:
-        item[key] = os.path.join(DirectoryName, item[key])
-
-
-# Generate summary data and save files
-ZygoteSummary = cvrsummarydata(ZygoteFiles, ZygoteTransitions, myparams)
-hu.savemydf(ZygoteSummary, 'CVR_zygotes_summaryinfo', 'csv')
-CleaverSummary = cvrsummarydata(CleaverFiles, CleaverTransitions, myparams)
-hu.savemydf(CleaverSummary, 'CVR_cleavers_summaryinfo', 'csv')
-
-# Calculte CIs for parameters of interest and save in json format.
-savefilename = 'CVR_summary_data.json'
-descriptions = {'RecoveredFraction': {'about':
-                                      '(V(tmax)-min(V))/(V(initial)-min(V))',
-                                      'ci method': 'T', 'ci interval': 0.95},
-                'MinVolRatio': {'about': 'min(V)/V(initial)',
-                                'ci method': 'T', 'ci interval': 0.95},
-                'TimeConstEst': {'about':
-                                 'Upper bound on time constant for shrinkage',
-                                 'ci method': 'Bernoulli', 'ci interval': 0.95
-                                 },
-                'TimeToCutoff': {'About':
-                                 'Time when V reached cutoff',
-                                 'ci method': 'Bernoulli', 'ci interval': 0.95
-                                 }}
-
-for item in (CleaverSummary, ZygoteSummary):
-    if item is CleaverSummary:
-        myinfo = ['CleaverSummary']
-    elif item is ZygoteSummary:
-        myinfo = ['ZygoteSummary']
+    Parameters :
+    ------------
+    myarray : 1D numpy.array, numeric
+        values to search (e.g. sorted times)
+    target : float or numpy.array
+        value(s) to find closest elements to
+    bounds : float or numpy.array
+        maximum distance from target (broadcast against target)
+
+    Returns :
+    ---------
+    If target and bounds are scalars: index (int), or np.nan if no element is
+    within bounds. Otherwise array (broadcast shape of target and bounds) of
+    indices as floats, with np.nan where no element is within bounds.
+    """
+    myarray = np.asarray(myarray)
+    targets, bounds = np.broadcast_arrays(np.asarray(target, dtype=float),
+                                          np.asarray(bounds, dtype=float))
+    if np.any(myarray[1:] < myarray[:-1]):
+        order = np.argsort(myarray, kind='mergesort')
     else:
-        print('Unexpected item name')
-    myfilename = myinfo[0] + '_CIs.json'
-    myinfo += ['Run on: ' + time.ctime()]
-    myinfo += [myparams]
-    for key in descriptions:
-        mydata = pandas.to_numeric(item[key].values)
-        if descriptions[key]['ci method'] == 'T':
-            myinfo += [{key: [descriptions[key],
-                        hs.cit(mydata, descriptions[key]['ci interval'])]}]
-        elif descriptions[key]['ci method'] == 'Bernoulli':
-            myinfo += [{key: [descriptions[key],
-                        hs.cib(mydata, descriptions[key]['ci interval'])]}]
+        order = np.arange(len(myarray))
+    sortedarray = myarray[order]
+
+    # Candidates are elements on either side of where target would be
+    # inserted; take the closer one (the first in myarray if equally close).
+    # The sort is stable, so the first of equal elements in sortedarray is
+    # the first in myarray.
+    rightind = np.minimum(np.searchsorted(sortedarray, targets),
+                          len(sortedarray) - 1)
+    leftind = np.maximum(rightind - 1, 0)
+    leftdist = abs(sortedarray[leftind] - targets)
+    rightdist = abs(sortedarray[rightind] - targets)
+    leftfirst = order[np.searchsorted(sortedarray, sortedarray[leftind],
+                                      side='left')]
+    rightfirst = order[np.searchsorted(sortedarray, sortedarray[rightind],
+                                       side='left')]
+    candidate = np.where(rightdist < leftdist, rightfirst,
+                         np.where(leftdist < rightdist, leftfirst,
+                                  np.minimum(leftfirst, rightfirst)))
+    mindist = np.minimum(leftdist, rightdist)
+
+    if targets.ndim == 0:
+        if mindist < bounds:
+            return int(candidate)
         else:
-            print('problem with ', key)
-    hu.savedictasjson(myinfo, myfilename)
-
-
-
+            return np.nan
+    return np.where(mindist < bounds, candidate, np.nan)
+
+
+if __name__ == '__main__':
+    # Generate path to files.
+    for item in [ZygoteFiles, CleaverFiles]:
+        for key in item:
+            item[key] = os.path.join(DirectoryName, item[key])
+
+    # Generate summary data and save files
+    ZygoteSummary = cvrsummarydata(ZygoteFiles, ZygoteTransitions, myparams)
+    hu.savemydf(ZygoteSummary, 'CVR_zygotes_summaryinfo', 'csv')
+    CleaverSummary = cvrsummarydata(CleaverFiles, CleaverTransitions, myparams)
+    hu.savemydf(CleaverSummary, 'CVR_cleavers_summaryinfo', 'csv')
+
+    # Calculte CIs for parameters of interest and save in json format.
+    savefilename = 'CVR_summary_data.json'
+    for item in (CleaverSummary, ZygoteSummary):
+        if item is CleaverSummary:
+            myinfo = ['CleaverSummary']
+        elif item is ZygoteSummary:
+            myinfo = ['ZygoteSummary']
+        else:
+            print('Unexpected item name')
+        myfilename = myinfo[0] + '_CIs.json'
+        myinfo += ['Run on: ' + time.ctime()]
+        myinfo += [myparams]
+        cidf = summarycis(item, descriptions).set_index('Value')
+        for key in descriptions:
+            if descriptions[key]['ci method'] == 'T':
+                centername = 'mean'
+            else:
+                centername = 'median'
+            myinfo += [{key: [descriptions[key],
+                              {centername: cidf.loc[key, 'Center'],
+                               'LB': cidf.loc[key, 'LB'],
+                               'UB': cidf.loc[key, 'UB']}]}]
+        hu.savedictasjson(myinfo, myfilename)
@@ -23,6 +23,10 @@ BlobViewer class & methods :
     whether blobs/ROIs were linked correctly.
 seqprocess
     Import and process data from ImageJ macro.
+loadsequence, assignimgroups, processsequence
+    Steps 2-3 below for one sequence, without user input.
+batchprocess
+    Process all sequences in info file in parallel and save processed files.
 
 Requires:
 --------
@@ -33,16 +37,17 @@ each sequence
 •Scale info (CURRENTLY CODED IN SCRIPT)
 •Directory path for files (CURRENTLY CODED IN SCRIPT)
 Modules/packages:
-    pandas, numpy, json, matplotlib.pyplot, skimage.external.tifffile,
-    TrackPoints
+    pandas, numpy, json, matplotlib.pyplot, TrackPoints, hambits (utils,
+    volumes, cache, images; images needs skimage.external.tifffile)
 
 Steps to process files from ImageJ results
 ------------------------------------------
 1) Read data file and info file.
 
 2) Calculations on data and split or remove data based on info file.
- 2a: Split 'Label' to get time stamps and file codes
- 2b: Calculate volume
+ 2a: Parse 'Label' to get time stamps and file codes (hambits.cache)
+ 2b: Calculate volume (hambits.volumes model 'FeretSphere'; other models
+ can be added as extra columns for comparison)
  2c: Divide data into two sets (before and after transition) and delete frames
  during transition (identify manually)
  2d: For sequences split into separate parts in different polders, combine data
@@ -63,12 +68,17 @@ import numpy as np
 import json
 import TrackPoints
 import matplotlib.pyplot as plt
-import skimage.external.tifffile as tifmod
 
 import os, sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 lib_path = os.path.abspath('..')
 sys.path.append(lib_path)
 import hambits.utils as hu
+import hambits.images as hi
+import hambits.volumes as hv
+import hambits.cache as hc
 
 # Parent directory
 parentdir = 'C:\\Users\\Michelangelo\\Documents\\Ham\\'
@@ -80,13 +90,19 @@ MicronsPerPixel = 0.338774005
 
 
 class BlobViewer:
-    def __init__(self, blobdata, folderlist, scale=10):
+    def __init__(self, blobdata, folderlist, scale=10, cachesize=20,
+                 prefetch=3):
         """
         Create a event-driven figure with which one can scroll through images
         in image sequence and see blobs labeled by 'blobID' at XY centers.
         Image files are found in folders of folderlist, and referred to by info
         in blobdata dataframe.
 
+        Images are loaded when first shown (not all at start), downsampled,
+        and kept in a cache of the cachesize most recently used images. After
+        each move forward or back, the next 'prefetch' images in that
+        direction are loaded in a background thread.
+
         Actions (when mouse is within figure axes) :
         -------
         '.' key press : show next image in sequence, & corresponding blob IDs
@@ -96,13 +112,18 @@ class BlobViewer:
         Parameters :
         ------------
         blobdata : pandas dataframe
-            Must contain columns 'X', 'Y', 'Label' (with the form '*:*:*'),
-            'Time', and 'blobID'; blobID, X, & Y must be numeric.
+            Must contain columns 'X', 'Y', 'Time', 'blobID', and 'ImageFile'
+            (image file name without extension, from seqprocess) or 'Label'
+            (with the form '*:*:*'); blobID, X, & Y must be numeric.
         folderlist :  list
             List of folder paths (as strings) associated with image sequences
             described in blobdata
         scale : int
             How much to downsample the image by.
+        cachesize : int
+            Maximum number of (downsampled) images to keep in memory.
+        prefetch : int
+            Number of images to load ahead in the direction of travel.
 
         Returns :
         ---------
@@ -111,6 +132,8 @@ class BlobViewer:
         self.foldernames = folderlist
         self.blobdata = blobdata
         self.scale = int(scale)
+        self.cachesize = max(int(cachesize), 1)
+        self.prefetch = int(prefetch)
 
         # Timelist contains times associated with images, in order.
         self.timelist = sorted(list(set(blobdata['Time'].values)))
@@ -124,37 +147,115 @@ class BlobViewer:
         self.useraction = self.fig.canvas.mpl_connect(
             'key_press_event', self.wherenext)
 
-        # Initialize dicts to store file names (self.filedict), indices in
-        # blobdata df for blobs in each image (self.indsdict), and image data
-        # (self.imdict) as nparrays.
-        self.filedict = dict.fromkeys(self.timelist)
-        self.indsdict = dict.fromkeys(self.timelist)
-        self.imdict = dict.fromkeys(self.timelist)
-
-        # Go through times in timelist and get indices for blobs, filename
-        # and image
-        for loopt in self.timelist:
-            self.indsdict[loopt] = self.blobdata[self.blobdata['Time'] == loopt
-                                                 ].index.tolist()
-            self.filedict[loopt] = self.blobdata.loc[min(self.indsdict[loopt]),
-                                                     'Label'].rsplit(
-                                                     ':', 1)[1] + '.tif'
-            # Try to find filename for image at time loopt in each folder; stop
-            # when find it.
-            for myfolder in self.foldernames:
-                try:
-                    currentimage = tifmod.imread(os.path.join(myfolder,
-                                                 self.filedict[loopt]))
-                except:
-                    continue
-                else:
-                    self.imdict[loopt] = currentimage[::self.scale,
-                                                      ::self.scale]
-                    break
+        # Dicts of indices in blobdata df for blobs in each image
+        # (self.indsdict) and file names (self.filedict), in one pass over
+        # blobdata. File names are parsed from labels only if blobdata has no
+        # 'ImageFile' column (e.g. older processed files).
+        self.indsdict = {t: sorted(inds.tolist()) for t, inds in
+                         self.blobdata.groupby('Time').groups.items()}
+        if 'ImageFile' in self.blobdata.columns:
+            imagefiles = self.blobdata['ImageFile']
+        else:
+            imagefiles = pandas.Series(hc.labelfiles(self.blobdata['Label']),
+                                       index=self.blobdata.index)
+        self.filedict = {t: str(imagefiles.loc[min(self.indsdict[t])]) +
+                         '.tif' for t in self.timelist}
+
+        # Index of which folder holds each file: list each folder once (the
+        # first folder in foldernames with the file is used).
+        self.folderindex = {}
+        for myfolder in self.foldernames:
+            try:
+                filenames = os.listdir(myfolder)
+            except OSError:
+                continue
+            for filename in filenames:
+                self.folderindex.setdefault(filename, myfolder)
+
+        # LRU cache of downsampled images (self.imcache), background loads in
+        # progress (self.pending), and lock for both.
+        self.imcache = OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.loader = ThreadPoolExecutor(max_workers=1)
 
         # Create figure with first image and associated blobs.
         self.showblobs()
 
+    def loadimage(self, t):
+        """
+        Read image for time t from disk and downsample it by self.scale.
+        Returns None if the file is not in any folder in self.foldernames.
+        """
+        filename = self.filedict[t]
+        if filename not in self.folderindex:
+            return None
+        # Memory-mapped if possible, so only the downsampled pixels are read.
+        currentimage = hi.readframe(os.path.join(self.folderindex[filename],
+                                                 filename))
+        # Copy so the full resolution image is not kept in memory.
+        return hi.downsample(currentimage, self.scale).copy()
+
+    def cacheimage(self, t, image):
+        """
+        Put image for time t in cache, dropping least recently used images
+        beyond self.cachesize.
+        """
+        with self.lock:
+            self.imcache[t] = image
+            self.imcache.move_to_end(t)
+            while len(self.imcache) > self.cachesize:
+                self.imcache.popitem(last=False)
+            self.pending.pop(t, None)
+
+    def prefetchimage(self, t):
+        """
+        Load image for time t into cache (run in background thread).
+        """
+        with self.lock:
+            if t in self.imcache:
+                return
+        try:
+            image = self.loadimage(t)
+        except Exception:
+            # Leave it to getimage to load (and report errors) when shown.
+            with self.lock:
+                self.pending.pop(t, None)
+            return
+        self.cacheimage(t, image)
+
+    def getimage(self, t):
+        """
+        Get downsampled image for time t: from cache, from a background load
+        in progress, or from disk.
+        """
+        with self.lock:
+            if t in self.imcache:
+                self.imcache.move_to_end(t)
+                return self.imcache[t]
+            future = self.pending.get(t)
+        if future is not None:
+            future.result()
+            with self.lock:
+                if t in self.imcache:
+                    return self.imcache[t]
+        image = self.loadimage(t)
+        self.cacheimage(t, image)
+        return image
+
+    def prefetchimages(self, step):
+        """
+        Start background loads of the next self.prefetch images in direction
+        step (+1: forward, -1: back) from self.t.
+        """
+        tind = self.timelist.index(self.t)
+        for k in range(1, self.prefetch + 1):
+            t = self.timelist[(tind + step*k) % len(self.timelist)]
+            with self.lock:
+                if (t in self.imcache) or (t in self.pending):
+                    continue
+                self.pending[t] = self.loader.submit(self.prefetchimage, t)
+
     def showblobs(self):
         """
         Update figure with image and blobs associated with time self.t
@@ -169,8 +270,12 @@ class BlobViewer:
         """
         self.ax.remove()
         self.ax = self.fig.add_subplot(111)
-        self.ax.imshow(self.imdict[self.t], cmap='gray')
-        self.ax.set_title('Image: ' + self.filedict[self.t])
+        image = self.getimage(self.t)
+        if image is None:
+            self.ax.set_title('Image not found: ' + self.filedict[self.t])
+        else:
+            self.ax.imshow(image, cmap='gray')
+            self.ax.set_title('Image: ' + self.filedict[self.t])
         for ind in self.indsdict[self.t]:
             self.ax.text(self.blobdata.loc[ind, 'X']/self.scale,
                          self.blobdata.loc[ind, 'Y']/self.scale,
@@ -191,16 +296,19 @@ class BlobViewer:
                 except:
                     self.t = self.timelist[0]
                 self.showblobs()
+                self.prefetchimages(1)
             elif event.key == ',':
                 self.t = self.timelist[tind - 1]
                 self.showblobs()
+                self.prefetchimages(-1)
             elif event.key == 'c':
                 plt.close(self.fig)
+                self.loader.shutdown(wait=False)
             else:
                 pass
 
 
-def seqprocess(infodf, ind, folder, scale):
+def seqprocess(infodf, ind, folder, scale, volumemodels=()):
     """
     Import and process data from ImageJ macro.
     Note: image sequences may be broken up into parts (e.g. if capture stalled
@@ -236,12 +344,15 @@ def seqprocess(infodf, ind, folder, scale):
     ind : row index to get values from in infodf
     folder : parent directory path for SetDir.
     scale : scale for calculating volume
+    volumemodels : list of names of models in hambits.volumes.volumemodels
+        for extra columns 'Volume_<model name>' (e.g. for comparing models)
 
     Returns :
     Pandas data frame. Columns are the same as the text file, but the ' ' is
-    renamed to 'IJind', 'Label' is parsed to give 'Image' and 'Time' columns,
-    and 'Volume' is calculated. The data frames from multi-part sequences may
-    be combined depending on user input.
+    renamed to 'IJind', 'Label' is parsed to give 'Image' and 'Time' columns
+    and categorical 'ImageFile' column (image file name, used by BlobViewer),
+    and 'Volume' (and any 'Volume_<model name>') is calculated. The data
+    frames from multi-part sequences may be combined depending on user input.
     """
     # Sequence directory name. Assumes data is in sub folder 'flattened'!
     seqfolder = os.path.join(folder, infodf.SetDir[ind],
@@ -265,188 +376,360 @@ def seqprocess(infodf, ind, folder, scale):
     'Cannot'). If so, don't need to parse metadata about moving embryos, etc.
     """
 
-    # import data from file
-    curdata = pandas.read_csv(os.path.join(seqfolder, seqfile), delimiter='\t')
-
-    # Replace ImageJ index column name (ImageJ labels as ' ') with 'IJind'
-    newcolnames = dict(zip(curdata.columns, curdata.columns))
-    newcolnames[' '] = 'IJind'
-    curdata.rename(columns=newcolnames, inplace=True)
+    # Import data from file, with ImageJ index column (' ') renamed 'IJind',
+    # and frame (image) and time information split out from Label column.
+    # Parsed data are cached, so the text file is only parsed again if it
+    # changes.
+    curdata = hc.loadresults(os.path.join(seqfolder, seqfile))
 
-    # Split out frame (image) and time information from Label column
-    curdata['Image'] = pandas.to_numeric(
-        curdata['Label'].str.rsplit(':', 1).str[1].str.rsplit('_', 1).str[0])
-    curdata['Time'] = pandas.to_numeric(
-                                curdata['Label'].str.rsplit('_', 1).str[1])
-
-    # Calculate volume in cubic micrometers.
-    curdata['Volume'] = (4*np.pi/3)*(
-        scale*(curdata['Feret']+curdata['MinFeret'])/4)**3
+    # Calculate volume in cubic micrometers (sphere with mean of Feret and
+    # MinFeret as diameter), and volumes from other models if requested.
+    curdata['Volume'] = hv.volume(curdata, 'FeretSphere', scale)
+    hv.addvolumes(curdata, volumemodels, scale)
 
     # Remove unusable rows.
     # ImageJ spits out column of indices starting from 1; because the data file
     # may be edited, Pandas' indices might not be simply related to ImageJ's.
-    # Therefore, create list of indices (dataframe) for which value in column
-    # 'IJinds' matches any value in delmeaslist, or matches image names between
-    # end1 and begin2 (to get rid of unmeasurable images... this code could
-    # definitely be optimized.
-    dropinds = []
-    for k in curdata.index:
-        if any(x == curdata['IJind'][k] for x in delmeaslist) | (
-                                    begin2 > curdata['Image'][k] > end1):
-                dropinds.append(k)
+    # Therefore, mask rows for which value in column 'IJinds' matches any value
+    # in delmeaslist, or matches image names between end1 and begin2 (to get
+    # rid of unmeasurable images).
+    dropmask = curdata['IJind'].isin(delmeaslist).values | (
+                (curdata['Image'].values > end1) &
+                (curdata['Image'].values < begin2))
 
     # Define column to specify if images are of blobs in first medium (0) or
     # second medium (1)
     curdata['Media'] = curdata['Image'] >= begin2
 
     # Define column for images that are moving.
-    moveimages = []
-    for item in movelist:
-        if len(item) == 2:
-            moveimages = moveimages + (list(range(item[0], item[1]+1)))
-        elif (len(item) != 2) & (len(item) != 0):
+    curdata['Moving'] = inintervals(curdata['Image'].values, movelist)
+
+    return curdata[~dropmask]
+
+
+def inintervals(values, intervallist):
+    """
+    Check which values fall in any of a list of closed intervals (e.g.
+    'UseButMoving' periods: [[first image, last image], ...]).
+
+    Intervals are sorted by start once; each value is then located with a
+    binary search, and is inside an interval if the largest end among
+    intervals starting at or before it is >= the value (this also handles
+    overlapping intervals).
+
+    Parameters :
+    ------------
+    values : 1D numpy.array, numeric
+    intervallist : list of lists
+        each sub-list is [start, end] (inclusive), or empty (ignored)
+
+    Returns :
+    ---------
+    boolean numpy.array, same shape as values
+    """
+    for item in intervallist:
+        if (len(item) != 2) & (len(item) != 0):
             print(len(item))
             raise SystemExit(
                 'Error: "UseButMoving" has invalid sub-list length.')
-
-    curdata['Moving'] = curdata['Image'].isin(moveimages)
-
-    return curdata.drop(dropinds, axis=0)
+    intervals = np.array([item for item in intervallist if len(item) == 2],
+                         dtype=float).reshape(-1, 2)
+    if len(intervals) == 0:
+        return np.zeros(np.shape(values), dtype=bool)
+    intervals = intervals[np.argsort(intervals[:, 0], kind='mergesort')]
+    maxends = np.maximum.accumulate(intervals[:, 1])
+    pos = np.searchsorted(intervals[:, 0], values, side='right') - 1
+    return (pos >= 0) & (maxends[np.maximum(pos, 0)] >= values)
 
 def savecurdata(datadf, infodf, ind):
     if len(ind) > 0:
         ind = ind[0]
     newfile = infodf.MyFile[ind]
 
-"""
-Read datafile with user-generated metadata about each image sequence and get
-user input for which sequence to process
-"""
-seqinfo = pandas.read_csv(infofile, delimiter='\t', header=2)
-imseq = input('Which image sequence to analyze?')
 
-"""
-Read in files associated with the seqence 'imseq'. For any sequence which are
-split into different parts, ask if should combine the parts.
-The get the trackmethod (whether to try to track blobs in images listed in
-infofile as 'moving'.
-Then process (and possibly combine) information from csv file containing info
-on blobs.
-"""
-try:
+def readseqinfo(infofile):
+    """
+    Read tab delimited file with user-generated metadata about each image
+    sequence (see seqprocess for columns).
+    """
+    return pandas.read_csv(infofile, delimiter='\t', header=2)
+
+
+def loadsequence(seqinfo, imseq, FirstOrAll='F', folder=parentdir,
+                 scale=MicronsPerPixel, volumemodels=()):
+    """
+    Read in files associated with the sequence 'imseq' (with seqprocess). For
+    sequences which are split into different parts, use the first part
+    (FirstOrAll='F') or merge all parts (FirstOrAll='A'). volumemodels: see
+    seqprocess.
+
+    Returns :
+    ---------
+    tuple : (curdata, seqind, trackmethod)
+        curdata : dataframe from seqprocess (parts combined if merged)
+        seqind : list of indices of rows in seqinfo for the sequence
+        trackmethod : 'TrackMethod' of the sequence in seqinfo
+    """
+    seqind = list(seqinfo[seqinfo.Sequence == imseq].index)
+    if len(seqind) == 0:
+        raise SystemExit('Sequence name ' + str(imseq) +
+                         ' not in sequence info')
+    if FirstOrAll not in ('F', 'A'):
+        raise SystemExit('Invalid choice.')
+
+    curdata = seqprocess(infodf=seqinfo, ind=seqind[0], folder=folder,
+                         scale=scale, volumemodels=volumemodels)
+    # Identify method for tracking blobs in moving frames.
+    trackmethod = seqinfo.TrackMethod[seqind[0]]
+
+    if FirstOrAll == 'A':
+        for k in seqind[1:]:
+            curdata = pandas.concat((curdata, seqprocess(
+                                infodf=seqinfo, ind=k, folder=folder,
+                                scale=scale, volumemodels=volumemodels)),
+                                ignore_index=True)
+            if trackmethod != seqinfo.TrackMethod[k]:
+                raise SystemExit(
+                    '"TrackMethod" differs among parts of image sequence.')
+    else:
+        seqind = seqind[:1]
+
+    return curdata, seqind, trackmethod
+
+
+def assignimgroups(curdata, trackmethod):
+    """
+    Group data into image groups (in colum 'ImGroup' in curdata df).
+    If 'trackmethod' set to 'Auto' or 'Manual', just groups by media; if
+    'trackmethod' set to 'cannot', this creates separate groups for different
+    media and for each images marked as moving, so that no blob will be linked
+    between groups.
+    CURRENTLY SET TO IGNORE DIFFERENCE BETWEEN AUTO AND MANUAL.
+
+    Returns :
+    ---------
+    curdata, with column 'ImGroup' added.
+    """
+    if (trackmethod == 'Auto') | (trackmethod == 'Manual'):
+        curdata['ImGroup'] = curdata['Media'].astype(int)
+    elif trackmethod == 'Cannot':
+        # meastimelist : used to create dict of imtimedict and then associated
+        # dict values with rows in curdata data frame.
+        meastimelist = curdata['Time'].tolist()
+        # imtimedict : used to create imgrpdict
+        imtimedict = dict(zip(meastimelist,
+                              curdata[['Media', 'Moving']].values))
+        # imtimelist : used to create imgrpdict
+        imtimelist = sorted(imtimedict.keys())
+        # imgrpdict : associates image times with group numbers; group numbers
+        # uniquely identify segments of the sequence in which embryos should be
+        # trackable (not moving much, and in same media)
+        imgrpdict = dict.fromkeys(imtimelist, 0)
+        for k in range(1, len(imtimelist)):
+            imgrpdict[imtimelist[k]] = imgrpdict[imtimelist[k-1]] + int(
+                (imtimedict[imtimelist[k]][1] |
+                 imtimedict[imtimelist[k-1]][1]) | (
+                    imtimedict[imtimelist[k]][0] ^
+                    imtimedict[imtimelist[k-1]][0]))
+        # create column of curdata associating each image time with a group.
+        curdata['ImGroup'] = [imgrpdict[item] for item in meastimelist]
+    else:
+        raise SystemExit('Invalid track method option')
+
+    return curdata
+
+
+def processedfilename(seqinfo, seqind):
+    """
+    Name (without extension) of file for processed data for the sequence in
+    rows seqind of seqinfo: data file name of the first part + '_Processed'.
+    """
+    return seqinfo.loc[seqind, 'MyFile'].values[0].split('.')[0] + \
+        '_Processed'
+
+
+def processsequence(seqinfo, imseq, FirstOrAll='A', folder=parentdir,
+                    scale=MicronsPerPixel, destdir=None, linkparams={},
+                    volumemodels=(), gapparams=None):
+    """
+    Non-interactive processing of one image sequence: seqprocess (merging
+    parts as set by FirstOrAll, see loadsequence), image group assignment
+    (assignimgroups), linking of blobs (TrackPoints.linkpoints), and
+    optionally joining of tracks across gaps (TrackPoints.closegaps).
+
+    Parameters :
+    ------------
+    seqinfo : dataframe from readseqinfo
+    imseq : str, name of sequence (column 'Sequence' in seqinfo)
+    FirstOrAll : 'F' or 'A' (see loadsequence)
+    folder : parent directory path for SetDir
+    scale : scale for calculating volume
+    destdir : str or None
+        if not None, save processed data as comma-separated file
+        '<MyFile>_Processed.csv' in destdir (overwriting any existing file)
+    linkparams : dict
+        extra keyword arguments for TrackPoints.linkpoints (e.g. Matcher)
+    volumemodels : list of names of extra volume models (see seqprocess)
+    gapparams : dict or None
+        if not None, join tracks across missing frames after linking, with
+        TrackPoints.closegaps; extra keyword arguments for closegaps (e.g.
+        {'MaxGap': 2}). If None, tracks are not joined.
+
+    Returns :
+    ---------
+    tuple : (curdata, seqind, trackmethod), as for loadsequence.
+    """
+    curdata, seqind, trackmethod = loadsequence(seqinfo, imseq, FirstOrAll,
+                                                folder, scale, volumemodels)
+    curdata = assignimgroups(curdata, trackmethod)
+
+    # Link blobs in image groups (column 'ImGroup') using TrackPoints module
+    kwargs = dict(DataColumns=['X', 'Y'], InfoColumns=['Time', 'Major'],
+                  GroupNameColumn='ImGroup', BlobNameColumn='blobID',
+                  name1=0, ColWeights=[1, 1])
+    kwargs.update(linkparams)
+    TrackPoints.linkpoints(curdata, **kwargs)
+
+    # Optionally join tracks broken by missing frames
+    if gapparams is not None:
+        gapkwargs = dict(DataColumns=['X', 'Y'], FrameColumn='Time',
+                         SizeColumn='Major', GroupNameColumn='ImGroup',
+                         BlobNameColumn='blobID', ColWeights=[1, 1])
+        gapkwargs.update(gapparams)
+        TrackPoints.closegaps(curdata, **gapkwargs)
+
+    if destdir is not None:
+        curdata.to_csv(os.path.join(
+            destdir, processedfilename(seqinfo, seqind) + '.csv'))
+
+    return curdata, seqind, trackmethod
+
+
+def batchworker(args):
+    """
+    Process one sequence for batchprocess (in a worker process); returns name
+    of sequence and name of saved file, or error message.
+    """
+    (seqinfo, imseq, FirstOrAll, folder, scale, destdir, linkparams,
+     volumemodels, gapparams) = args
+    try:
+        curdata, seqind, trackmethod = processsequence(
+            seqinfo, imseq, FirstOrAll, folder, scale, destdir, linkparams,
+            volumemodels, gapparams)
+    except (Exception, SystemExit) as err:
+        return imseq, 'FAILED: ' + repr(err)
+    return imseq, processedfilename(seqinfo, seqind) + '.csv'
+
+
+def batchprocess(infofile=infofile, folder=parentdir, scale=MicronsPerPixel,
+                 destdir='.', FirstOrAll='A', sequences=None, nprocs=None,
+                 linkparams={}, volumemodels=(), gapparams=None):
+    """
+    Non-interactive processing of all sequences in infofile (e.g.
+    CellVolumeRegulation.txt), in parallel: each sequence is processed with
+    processsequence in a separate process, and saved as
+    '<MyFile>_Processed.csv' in destdir.
+
+    Parameters :
+    ------------
+    infofile : str, path of file with info about sequences (see readseqinfo)
+    folder, scale, FirstOrAll, linkparams, volumemodels, gapparams :
+        see processsequence
+    destdir : str, directory for processed files
+    sequences : list of str or None
+        names of sequences to process; if None, all sequences in infofile
+    nprocs : int or None
+        number of worker processes; if None, number of CPUs
+
+    Returns :
+    ---------
+    dict : {sequence name: name of saved file (or error message)}
+    """
+    seqinfo = readseqinfo(infofile)
+    if sequences is None:
+        # Unique sequence names, in order of appearance in infofile.
+        sequences = list(pandas.unique(seqinfo.Sequence.dropna().values))
+    jobs = [(seqinfo, imseq, FirstOrAll, folder, scale, destdir, linkparams,
+             volumemodels, gapparams) for imseq in sequences]
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=nprocs) as pool:
+        for imseq, result in pool.map(batchworker, jobs):
+            results[imseq] = result
+            print(imseq + ': ' + result)
+    return results
+
+
+if __name__ == '__main__':
+    """
+    Read datafile with user-generated metadata about each image sequence and
+    get user input for which sequence to process
+    """
+    seqinfo = readseqinfo(infofile)
+    imseq = input('Which image sequence to analyze?')
+
+    """
+    Read in files associated with the seqence 'imseq'. For any sequence which
+    are split into different parts, ask if should combine the parts.
+    The get the trackmethod (whether to try to track blobs in images listed in
+    infofile as 'moving'.
+    Then process (and possibly combine) information from csv file containing
+    info on blobs; group images; and link blobs.
+    """
     seqind = list(seqinfo[seqinfo.Sequence == imseq].index)
-    if len(seqind) > 1:
+    if len(seqind) == 0:
+        print(seqinfo.Sequence)
+        raise SystemExit('Sequence name does not match user input')
+    elif len(seqind) > 1:
         print('Multiple sequences match given name:')
         print(seqinfo[['Sequence', 'Part', 'MyFile']])
         FirstOrAll = input('Use first sequence [F], or merge all [A]?')
     else:
         FirstOrAll = 'F'
-
-except IndexError:
-    print('Sequence name does not match user input')
-    print(seqinfo.Sequence)
-else:
-    if (FirstOrAll == 'A') | (FirstOrAll == 'F'):
-        curdata = seqprocess(
-                    infodf=seqinfo, ind=seqind[0], folder=parentdir,
-                    scale=MicronsPerPixel)
-        # Identify method for tracking blobs in moving frames.
-        trackmethod = seqinfo.TrackMethod[seqind[0]]
-
-        if FirstOrAll == 'A':
-            for k in seqind[1:]:
-                curdata = curdata.append(
-                                seqprocess(
-                                    infodf=seqinfo, ind=k, folder=parentdir,
-                                    scale=MicronsPerPixel), ignore_index=True)
-                if trackmethod != seqinfo.TrackMethod[k]:
-                    raise SystemExit(
-                        '"TrackMethod" differs among parts of image sequence.')
-    else:
+    if (FirstOrAll != 'A') & (FirstOrAll != 'F'):
         raise SystemExit('Invalid choice.')
 
-"""
-Group data into image groups (in colum 'ImGroup' in curdata df). 
-If 'trackmethod' set to 'Auto' or 'Manual', just groups by media; if
-'trackmethod' set to 'cannot', this creates separate groups for different media
-and for each images marked as moving, so that no blob will be linked between
-groups.
-CURRENTLY SET TO IGNORE DIFFERENCE BETWEEN AUTO AND MANUAL.
-"""
-if (trackmethod == 'Auto') | (trackmethod == 'Manual'):
-    curdata['ImGroup'] = curdata['Media'].astype(int)
-elif trackmethod == 'Cannot':
-    # meastimelist : used to create dict of imtimedict and then associated dict
-    # values with rows in curdata data frame.
-    meastimelist = curdata['Time'].tolist()
-    # imtimedict : used to create imgrpdict
-    imtimedict = dict(zip(meastimelist,
-                          curdata[['Media', 'Moving']].values))
-    # imtimelist : used to create imgrpdict
-    imtimelist = sorted(imtimedict.keys())
-    # imgrpdict : associates image times with group numbers; group numbers
-    # uniquely identify segments of the sequence in which embryos should be
-    # trackable (not moving much, and in same media)
-    imgrpdict = dict.fromkeys(imtimelist, 0)
-    for k in range(1, len(imtimelist)):
-        imgrpdict[imtimelist[k]] = imgrpdict[imtimelist[k-1]] + int(
-            (imtimedict[imtimelist[k]][1] | imtimedict[imtimelist[k-1]][1]) | (
-                imtimedict[imtimelist[k]][0] ^ imtimedict[imtimelist[k-1]][0]))
-    # create column of curdata associating each image time with a group.
-    curdata['ImGroup'] = [imgrpdict[item] for item in meastimelist]
-    # cleanup
-    del meastimelist, imtimelist, imgrpdict, imtimedict
-else:
-    raise SystemExit('Invalid track method option')
-
-"""
-Link blobs in image groups (column 'ImGroup') using TrackPoints module
-"""
-TrackPoints.linkpoints(curdata, DataColumns=['X', 'Y'],
-                       InfoColumns=['Time', 'Major'],
-                       GroupNameColumn='ImGroup', BlobNameColumn='blobID',
-                       name1=0, ColWeights=[1, 1])
-
-"""
-Plot all linked blobs by time-volume.
-"""
-fig, ax = plt.subplots()
-colorlist = 'rgbcmyk'
-markerlist = 'o^sx+D'
-for k in set(curdata['blobID'].values.tolist()):
-    dfsub = curdata[curdata['blobID'] == k]
-    colval = colorlist[int(k) % len(colorlist)]
-    markval = markerlist[int(k) % len(markerlist)]
-    # Time of media change was between 0 and 1 minute after last frame in first
-    # media, therefore assign time of media change to midpoint (+30s), although
-    # the actual media change may have been a bit faster (not accounting for
-    # mixing time).
-    StartTime = curdata[curdata['Media'] == 0].Time.iloc[-1] + 30
-    ax.scatter((dfsub['Time'].values-StartTime)/60,
-               dfsub['Volume'].values/(1000),
-               color=colval, marker=markval, alpha=0.4)
-ax.set_ylim(bottom=0, top=600)
-ax.set_xlim(left=-10, right=70)
-ax.set_ylabel('Volume, pL')
-ax.set_xlabel('Time after media change, min')
-ax.set_title(imseq + ': cell volume over time')
+    curdata, seqind, trackmethod = processsequence(seqinfo, imseq,
+                                                   FirstOrAll)
 
+    """
+    Plot all linked blobs by time-volume.
+    """
+    fig, ax = plt.subplots()
+    colorlist = 'rgbcmyk'
+    markerlist = 'o^sx+D'
+    for k in set(curdata['blobID'].values.tolist()):
+        dfsub = curdata[curdata['blobID'] == k]
+        colval = colorlist[int(k) % len(colorlist)]
+        markval = markerlist[int(k) % len(markerlist)]
+        # Time of media change was between 0 and 1 minute after last frame in
+        # first media, therefore assign time of media change to midpoint
+        # (+30s), although the actual media change may have been a bit faster
+        # (not accounting for mixing time).
+        StartTime = curdata[curdata['Media'] == 0].Time.iloc[-1] + 30
+        ax.scatter((dfsub['Time'].values-StartTime)/60,
+                   dfsub['Volume'].values/(1000),
+                   color=colval, marker=markval, alpha=0.4)
+    ax.set_ylim(bottom=0, top=600)
+    ax.set_xlim(left=-10, right=70)
+    ax.set_ylabel('Volume, pL')
+    ax.set_xlabel('Time after media change, min')
+    ax.set_title(imseq + ': cell volume over time')
 
-"""
-Create figure to check link among blobs.
-"""
-foldernames = [parentdir + seqinfo.loc[q, 'SetDir'] + '\\' +
-               seqinfo.loc[q, 'SequenceDir'] + '\\flattened\\'
-               for q in seqind]
-temp = BlobViewer(curdata, foldernames)
+    """
+    Create figure to check link among blobs.
+    """
+    foldernames = [parentdir + seqinfo.loc[q, 'SetDir'] + '\\' +
+                   seqinfo.loc[q, 'SequenceDir'] + '\\flattened\\'
+                   for q in seqind]
+    temp = BlobViewer(curdata, foldernames)
 
-"""
-Function to save curdata to tab separated CSV file.
-Too much of a fight to get matplotlib to display figures before going on to the
-rest of the script and fucking up.
-When ready, run: hu.savemydf(curdata, destfilename, destextension)
-"""
-destfilename = seqinfo.loc[seqind, 'MyFile'].values[0].split('.')[0] + \
-               '_Processed'
-destextension = 'csv'
+    """
+    Function to save curdata to tab separated CSV file.
+    Too much of a fight to get matplotlib to display figures before going on to
+    the rest of the script and fucking up.
+    When ready, run: hu.savemydf(curdata, destfilename, destextension)
+    To process all sequences without user input, run batchprocess().
+    """
+    destfilename = processedfilename(seqinfo, seqind)
+    destextension = 'csv'
@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+"""
+Segment and measure embryos in image stacks: Python version of macro
+"measure embryos 5" in MeasureHamEmbryos.ijm (see there for reasoning behind
+steps), giving the same columns as ImageJ results files read by
+HamSequence.seqprocess.
+
+Steps (for each frame) :
+------------------------
+1) Gaussian blur (sigma=50) of image, threshold (ImageJ 'Default' method,
+dark objects), and find particles (size 3000-200000 pixels, circularity
+0.5-1, not touching edges, holes included): centers of embryos.
+2) Unsharp mask (radius=25, mask=0.5) of image, averaged with blurred image,
+thresholded ('Default' method) and closed (3x3).
+3) For each particle from 1), take 4-connected region of thresholded image 2)
+at center of particle's bounding box (with holes filled), and enlarge then
+shrink by 10 pixels.
+4) Measure regions: Area, X, Y, Major, Minor, Angle, Feret, FeretX, FeretY,
+FeretAngle, MinFeret (pixel units).
+
+Large blurs are done by FFT (cost does not depend on sigma), and frames are
+processed in parallel in chunks.
+
+Functions :
+-----------
+gaussianblur, unsharpmask : filters on last two axes of stacks
+defaultthreshold : ImageJ 'Default' (IsoData variant) threshold of a frame
+binaryclose, closeregion : morphological closing
+findparticles : filter particles by size, circularity and edges
+segmentframe : steps 1-4 for one frame
+segmentchunk : segmentframe for several frames (run in worker processes)
+segmentstack : segment and measure all frames in stack
+readstack : read image files into stack
+saveresults : save measurements as tab-delimited ImageJ-style results file
+
+Requires :
+----------
+numpy, scipy.ndimage, pandas, hambits.regions (measurements),
+hambits.images (for readstack)
+
+@author: Michelangelo
+"""
+import numpy as np
+import pandas
+import scipy.ndimage as ndi
+
+import os, sys
+from concurrent.futures import ProcessPoolExecutor
+lib_path = os.path.abspath('..')
+sys.path.append(lib_path)
+import hambits.images as hi
+import hambits.regions as hr
+
+# Parameters from macro "measure embryos 5"
+segparams = {'blursigma': 50, 'unsharpradius': 25, 'unsharpweight': 0.5,
+             'minsize': 3000, 'maxsize': 200000, 'mincircularity': 0.5,
+             'enlarge': 10}
+
+# Columns of ImageJ results files (in order)
+resultcols = [' ', 'Label', 'Area', 'X', 'Y', 'Major', 'Minor', 'Angle',
+              'Feret', 'Slice', 'FeretX', 'FeretY', 'FeretAngle', 'MinFeret']
+
+
+def gaussianblur(stack, sigma):
+    """
+    Gaussian blur of each frame (last two axes) of stack, by multiplying in
+    the frequency domain (cost does not depend on sigma). Edges are padded
+    with edge pixel values (as ImageJ).
+
+    Parameters :
+    ------------
+    stack : numpy array
+        frame (2D) or stack of frames (3D)
+    sigma : float
+        standard deviation of Gaussian, in pixels
+
+    Returns :
+    ---------
+    float numpy array, same shape as stack
+    """
+    stack = np.asarray(stack, dtype=float)
+    nrows, ncols = stack.shape[-2:]
+    pad = int(min(np.ceil(3*sigma), max(nrows, ncols)))
+    padwidth = [(0, 0)]*(stack.ndim - 2) + [(pad, pad), (pad, pad)]
+    padded = np.pad(stack, padwidth, mode='edge')
+    fy = np.fft.fftfreq(padded.shape[-2])[:, None]
+    fx = np.fft.rfftfreq(padded.shape[-1])[None, :]
+    transfer = np.exp(-2*(np.pi*sigma)**2*(fx**2 + fy**2))
+    blurred = np.fft.irfft2(np.fft.rfft2(padded)*transfer,
+                            s=padded.shape[-2:])
+    return blurred[..., pad:pad+nrows, pad:pad+ncols]
+
+
+def unsharpmask(stack, radius, weight, blurred=None):
+    """
+    Unsharp mask (as ImageJ): (image - weight*blurred)/(1 - weight), with
+    blurred a Gaussian blur with sigma=radius (passed in if already
+    calculated).
+    """
+    if blurred is None:
+        blurred = gaussianblur(stack, radius)
+    return (np.asarray(stack, dtype=float) - weight*blurred)/(1 - weight)
+
+
+def defaultthreshold(frame):
+    """
+    Threshold of frame by ImageJ 'Default' method (variant of IsoData, on a
+    256 bin histogram from min to max of frame).
+
+    Returns :
+    ---------
+    threshold (float): pixels <= threshold are objects (dark objects on light
+    background)
+    """
+    lo, hi = np.min(frame), np.max(frame)
+    if hi == lo:
+        return lo
+    binwidth = (hi - lo)/256
+    bins = np.minimum(((frame - lo)/binwidth).astype(int), 255)
+    hist = np.bincount(bins.ravel(), minlength=256).astype(float)
+    # ImageJ ignores first and last bins.
+    hist[0] = 0
+    hist[255] = 0
+    nonzero = np.flatnonzero(hist)
+    if len(nonzero) < 2:
+        level = 128
+    else:
+        minbin, maxbin = nonzero[0], nonzero[-1]
+        inds = np.arange(256)
+        # Mean of bins below and above each moving index (as in ImageJ,
+        # iterate from minbin until moving index passes the average).
+        cumcount = np.cumsum(hist)
+        cumsum = np.cumsum(inds*hist)
+        moving = np.arange(minbin, maxbin)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = (cumsum[moving]/cumcount[moving] +
+                      (cumsum[maxbin] - cumsum[moving]) /
+                      (cumcount[maxbin] - cumcount[moving]))/2
+        goon = (moving + 2 <= result) & (moving + 1 < maxbin - 1)
+        stop = np.argmin(goon) if not np.all(goon) else len(moving) - 1
+        level = int(np.round(result[stop]))
+    return lo + (level + 1)*binwidth
+
+
+def binaryclose(mask):
+    """
+    Close binary mask with 3x3 neighborhood (ImageJ 'Close-' with
+    iterations=1, count=1).
+    """
+    structure = np.ones((3, 3), dtype=bool)
+    dilated = ndi.binary_dilation(mask, structure=structure)
+    return ndi.binary_erosion(dilated, structure=structure,
+                              border_value=1)
+
+
+def closeregion(region, distance):
+    """
+    Enlarge region by distance, then shrink by distance (as ImageJ
+    'Enlarge...' of a selection), using Euclidean distance transforms.
+    """
+    enlarged = ndi.distance_transform_edt(np.logical_not(region)) <= distance
+    return ndi.distance_transform_edt(enlarged) > distance
+
+
+def findparticles(mask, params=segparams):
+    """
+    Label particles (8-connected) in mask, with holes included, that do not
+    touch edges, and are within size and circularity limits (as ImageJ
+    'Analyze Particles...' with exclude and include options).
+
+    Returns :
+    ---------
+    labels : 2D numpy array of int (kept particles labeled 1 to n)
+    n : int, number of kept particles
+    """
+    labels, nlabels = ndi.label(mask, structure=np.ones((3, 3)))
+    # Include holes (label filled regions again)
+    labels, nlabels = ndi.label(ndi.binary_fill_holes(labels > 0),
+                                structure=np.ones((3, 3)))
+    if nlabels == 0:
+        return labels, 0
+    area = np.bincount(labels.ravel(), minlength=nlabels + 1)[1:]
+    perimeter = hr.tracedperimeter(labels, nlabels)
+    circularity = np.minimum(4*np.pi*area/perimeter**2, 1)
+    edgelabels = np.unique(np.concatenate([labels[0, :], labels[-1, :],
+                                           labels[:, 0], labels[:, -1]]))
+    keep = ((area >= params['minsize']) & (area <= params['maxsize']) &
+            (circularity >= params['mincircularity']))
+    keep[edgelabels[edgelabels > 0] - 1] = False
+    # Relabel kept particles 1 to n
+    newlabels = np.r_[0, np.cumsum(keep)*keep]
+    return newlabels[labels], int(np.sum(keep))
+
+
+def segmentframe(frame, slicenum, slicelabel, title='flattened',
+                 params=segparams):
+    """
+    Segment and measure embryos in one frame (steps 1-4 in module
+    docstring).
+
+    Parameters :
+    ------------
+    frame : 2D numpy array
+        grayscale image
+    slicenum : int
+        slice number (from 1) of frame in stack
+    slicelabel : string
+        slice label (image file name without extension)
+    title : string
+        stack title (first part of 'Label')
+    params : dict
+        segmentation parameters (see segparams)
+
+    Returns :
+    ---------
+    pandas data frame (one row per region) with columns in resultcols
+    (except ' ')
+    """
+    frame = np.asarray(frame, dtype=float)
+    # 1) Centers of embryos, from blurred image
+    blurred = gaussianblur(frame, params['blursigma'])
+    centers, ncenters = findparticles(
+        blurred <= defaultthreshold(blurred), params)
+    # 2) Sharpened image averaged with blurred image, thresholded and closed
+    sharpened = unsharpmask(frame, params['unsharpradius'],
+                            params['unsharpweight'])
+    averaged = (sharpened + blurred)/2
+    mask = binaryclose(averaged <= defaultthreshold(averaged))
+    # 4-connected regions of mask
+    regions, nregions = ndi.label(mask)
+
+    # 3) Region at center of bounding box of each particle (a region may be
+    # found from more than one particle; it is then measured once, and its
+    # measurements repeated, as in ImageJ)
+    boxes = ndi.find_objects(centers, ncenters)
+    ycenters = np.array([(box[0].start + box[0].stop)//2 for box in boxes],
+                        dtype=int)
+    xcenters = np.array([(box[1].start + box[1].stop)//2 for box in boxes],
+                        dtype=int)
+    centerregions = regions[ycenters, xcenters]
+    centerregions = centerregions[centerregions > 0]
+    uniqueregions, inverse = np.unique(centerregions, return_inverse=True)
+    # Fill holes and close each region in window around it (closed regions
+    # may overlap, so they are kept as pixel lists)
+    margin = params['enlarge'] + 2
+    regionboxes = ndi.find_objects(regions, nregions)
+    labs, ys, xs = [], [], []
+    for k, regionlabel in enumerate(uniqueregions):
+        box = regionboxes[regionlabel - 1]
+        y0 = max(box[0].start - margin, 0)
+        x0 = max(box[1].start - margin, 0)
+        window = regions[y0:box[0].stop + margin, x0:box[1].stop + margin]
+        region = closeregion(ndi.binary_fill_holes(window == regionlabel),
+                             params['enlarge'])
+        regionys, regionxs = np.nonzero(region)
+        labs.append(np.full(len(regionys), k + 1))
+        ys.append(regionys + y0)
+        xs.append(regionxs + x0)
+    if len(uniqueregions) == 0:
+        return pandas.DataFrame(columns=resultcols[1:])
+
+    # 4) Measure all regions at once
+    measures = hr.measurepixels(np.concatenate(labs), np.concatenate(ys),
+                                np.concatenate(xs), len(uniqueregions))
+    results = measures.iloc[inverse].reset_index(drop=True)
+    results['Label'] = (title + ':' + str(slicenum).zfill(4) + '-' +
+                        results['Y'].astype(int).astype(str).str.zfill(4) +
+                        '-' +
+                        results['X'].astype(int).astype(str).str.zfill(4) +
+                        ':' + slicelabel)
+    results['Slice'] = slicenum
+    return results[resultcols[1:]]
+
+
+def segmentchunk(args):
+    """
+    segmentframe for each frame in a chunk of frames; used by segmentstack.
+
+    Parameters :
+    ------------
+    args : tuple
+        (frames, slicenums, slicelabels, title, params)
+
+    Returns :
+    ---------
+    pandas data frame (see segmentframe)
+    """
+    frames, slicenums, slicelabels, title, params = args
+    return pandas.concat(
+        [segmentframe(frame, slicenum, slicelabel, title, params)
+         for frame, slicenum, slicelabel in zip(frames, slicenums,
+                                                slicelabels)],
+        ignore_index=True)
+
+
+def segmentstack(stack, slicelabels, title='flattened', params=segparams,
+                 nprocs=None, chunksize=4):
+    """
+    Segment and measure embryos in all frames of stack, with chunks of
+    frames processed in parallel.
+
+    Parameters :
+    ------------
+    stack : 3D numpy array (frame, row, column), or list of 2D arrays
+    slicelabels : list of strings
+        slice label (image file name without extension) of each frame
+    title : string
+        stack title (first part of 'Label')
+    params : dict
+        segmentation parameters (see segparams)
+    nprocs : int or None
+        number of processes (None: number of CPUs; 1: in this process)
+    chunksize : int
+        number of frames per chunk
+
+    Returns :
+    ---------
+    pandas data frame with columns in resultcols (as ImageJ results file)
+    """
+    jobs = [(stack[start:start+chunksize],
+             range(start + 1, min(start + chunksize, len(stack)) + 1),
+             slicelabels[start:start+chunksize], title, params)
+            for start in range(0, len(stack), chunksize)]
+    if nprocs == 1:
+        chunkresults = list(map(segmentchunk, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=nprocs) as executor:
+            chunkresults = list(executor.map(segmentchunk, jobs))
+    results = pandas.concat(chunkresults, ignore_index=True)
+    results.insert(0, ' ', np.arange(1, len(results) + 1))
+    return results
+
+
+def readstack(folder, extension='tif'):
+    """
+    Read all images with extension in folder (in sorted order of names).
+
+    Returns :
+    ---------
+    stack : list of 2D numpy arrays (memory-mapped if possible)
+    slicelabels : list of file names without extension
+    """
+    filenames = sorted(name for name in os.listdir(folder)
+                       if name.endswith('.' + extension))
+    stack = [hi.readframe(os.path.join(folder, name)) for name in filenames]
+    slicelabels = [name[:-(len(extension) + 1)] for name in filenames]
+    return stack, slicelabels
+
+
+def saveresults(results, filename):
+    """
+    Save results data frame (from segmentstack) as tab-delimited file, in
+    format of ImageJ results files (readable by HamSequence.seqprocess).
+    """
+    results.to_csv(filename, sep='\t', index=False, float_format='%.3f')
+
+
+if __name__ == '__main__':
+    # Usage: python SegmentEmbryos.py imagefolder resultsfile
+    # (run from CVR folder, so that hambits can be imported)
+    folder, resultsfile = sys.argv[1:3]
+    stack, slicelabels = readstack(folder)
+    saveresults(segmentstack(stack, slicelabels,
+                             title=os.path.basename(os.path.normpath(folder))),
+                resultsfile)
@@ -292,4 +292,262 @@ def test_varypositions(nstart=3, ngained=2, relativenoise=0.1, verbose=False):
     return out1, out2, out3
 
 
+def test_assignment(nstart=20, ngained=3, relativenoise=0.001, verbose=False):
+    """
+    Test 'assignment' matcher against 'greedy' matcher when point positions
+    are jiggled, indices are reordered, and some points are added; then test
+    that a point moved beyond the gating distance (maxdist) is treated as
+    lost/new rather than linked.
+
+    Returns true if the assignment matcher links every point in df1 to the
+    same point in df2 (column D is a persistant index), if its sum of squared
+    distances is no larger than that of the greedy matcher, and if gating
+    makes the far point lost/new.
+    """
+    nfinal = nstart + ngained
+    xy = np.random.random((nfinal, 2))
+    xy2 = xy + relativenoise * np.random.random((nfinal, 2))
+
+    df1 = pandas.DataFrame({'T': np.zeros(nstart), 'X': xy[:nstart, 0],
+                            'Y': xy[:nstart, 1], 'D': np.arange(0, nstart)},
+                           index=np.arange(0, nstart))
+    df2 = pandas.DataFrame({'T': np.ones(nfinal), 'X': xy2[:, 0],
+                            'Y': xy2[:, 1], 'D': np.arange(0, nfinal)},
+                           index=np.arange(nstart, nstart + nfinal))
+    df2.sort_values('Y', inplace=True)
+    df2.reset_index(drop=True, inplace=True)
+
+    mypoints = TrackPoints.pointcollection(df1, datacols=['X', 'Y'],
+                                           infocols=['T', 'D'],
+                                           firstpointname=0, weights=[1, 1],
+                                           matcher='assignment')
+    newpoints = TrackPoints.pointcollection(df2, datacols=['X', 'Y'],
+                                            infocols=['T', 'D'],
+                                            firstpointname=0, weights=[1, 1])
+    assigned = mypoints.matchpoints(newpoints)
+    greedy = mypoints.matchpoints(newpoints, matcher='greedy')
+
+    if verbose:
+        print(assigned)
+        print(greedy)
+
+    # Test that each old point is linked to the new point with the same D
+    out1 = np.all(mypoints.points['D'].values[assigned['matched'][0]] ==
+                  newpoints.points['D'].values[assigned['matched'][1]])
+    # Test that assignment is at least as good as greedy matching
+    out2 = assigned['sqrdists'].sum() <= greedy['sqrdists'].sum() + 1e-12
+
+    # Move one point far away: with gating it should be lost and new
+    df3 = df1.copy()
+    df3.loc[0, 'X'] += 10
+    farpoints = TrackPoints.pointcollection(df3, datacols=['X', 'Y'],
+                                            infocols=['T', 'D'],
+                                            firstpointname=0, weights=[1, 1])
+    gated = mypoints.matchpoints(farpoints, maxdist=1)
+    out3 = (gated['lost'][0] == [0]) & (gated['new'][1] == [0]) & (
+            len(gated['matched'][0]) == nstart - 1)
+    return out1, out2, out3
+
+
+def test_linkradius(nstart=50, ngained=5, relativenoise=0.001, seed=0,
+                    verbose=False):
+    """
+    Test matching restricted to candidate pairs within linkradius (KD-tree)
+    when point positions are jiggled, indices are reordered, and some points
+    are added.
+
+    Returns true if the greedy and assignment matchers with linkradius both
+    link every point in df1 to the same point in df2 (column D is a
+    persistant index), and if the sparse assignment matcher gives the same
+    links as the dense assignment matcher gated at the same distance. Points
+    are drawn with a seeded generator (seed), as two points closer than the
+    noise can be swapped by the greedy matcher.
+    """
+    rng = np.random.RandomState(seed)
+    nfinal = nstart + ngained
+    xy = rng.random_sample((nfinal, 2))
+    xy2 = xy + relativenoise * rng.random_sample((nfinal, 2))
+
+    df1 = pandas.DataFrame({'T': np.zeros(nstart), 'X': xy[:nstart, 0],
+                            'Y': xy[:nstart, 1], 'D': np.arange(0, nstart)},
+                           index=np.arange(0, nstart))
+    df2 = pandas.DataFrame({'T': np.ones(nfinal), 'X': xy2[:, 0],
+                            'Y': xy2[:, 1], 'D': np.arange(0, nfinal)},
+                           index=np.arange(nstart, nstart + nfinal))
+    df2.sort_values('Y', inplace=True)
+    df2.reset_index(drop=True, inplace=True)
+
+    mypoints = TrackPoints.pointcollection(df1, datacols=['X', 'Y'],
+                                           infocols=['T', 'D'],
+                                           firstpointname=0, weights=[1, 1],
+                                           linkradius=0.05)
+    newpoints = TrackPoints.pointcollection(df2, datacols=['X', 'Y'],
+                                            infocols=['T', 'D'],
+                                            firstpointname=0, weights=[1, 1])
+    greedy = mypoints.matchpoints(newpoints, matcher='greedy')
+    sparse = mypoints.matchpoints(newpoints, matcher='assignment')
+    mypoints.linkradius = None
+    dense = mypoints.matchpoints(newpoints, matcher='assignment',
+                                 maxdist=0.05)
+
+    if verbose:
+        print(greedy)
+        print(sparse)
+
+    oldD = mypoints.points['D'].values
+    newD = newpoints.points['D'].values
+    out1 = np.all(oldD[greedy['matched'][0]] == newD[greedy['matched'][1]]
+                  ) & (len(greedy['matched'][0]) == nstart)
+    out2 = np.all(oldD[sparse['matched'][0]] == newD[sparse['matched'][1]]
+                  ) & (len(sparse['matched'][0]) == nstart)
+    out3 = (sorted(zip(*sparse['matched'])) == sorted(zip(*dense['matched'])))
+    return out1, out2, out3
+
+
+def test_linkpoints(npoints=10, nframes=6, relativenoise=0.001,
+                    verbose=False):
+    """
+    Test TrackPoints.linkpoints on a shuffled dataframe with jiggled points in
+    several frames, split into two image groups.
+
+    Returns true if every point (column D is a persistant index) gets one
+    blobID within each image group, if blobIDs differ between points and
+    between image groups, and if the order of rows in df is preserved.
+    """
+    xy = np.random.random((npoints, 2))
+    frames = []
+    for t in range(nframes):
+        xyt = xy + relativenoise * np.random.random((npoints, 2))
+        frames.append(pandas.DataFrame({
+            'Time': np.full(npoints, 60*t), 'X': xyt[:, 0], 'Y': xyt[:, 1],
+            'Major': np.ones(npoints), 'D': np.arange(0, npoints),
+            'ImGroup': np.full(npoints, int(t >= nframes//2))}))
+    df = pandas.concat(frames, ignore_index=True)
+    df = df.sample(frac=1)
+    inputindex = df.index.values.copy()
+
+    df = TrackPoints.linkpoints(df, DataColumns=['X', 'Y'],
+                                InfoColumns=['Time', 'Major'],
+                                GroupNameColumn='ImGroup',
+                                BlobNameColumn='blobID')
+    if verbose:
+        print(df.sort_values(['Time', 'D']))
+
+    ids = df.groupby(['ImGroup', 'D'])['blobID']
+    # Test that each point has a single blobID within each group
+    out1 = np.all(ids.nunique().values == 1)
+    # Test that blobIDs are unique to points and groups
+    out2 = len(set(df['blobID'].values)) == 2*npoints
+    # Test that row order is unchanged
+    out3 = np.all(df.index.values == inputindex)
+    return out1, out2, out3
+
+
+def test_trackstore(nstart=5, nadded=40, verbose=False):
+    """
+    Test that TrackPoints.trackstore keeps points when it grows past its
+    initial capacity, updates points in place, and gives the same values in
+    its dataframe view (trackstore.points).
+    """
+    xy = np.random.random((nstart + nadded, 2))
+    info = np.column_stack((np.zeros(nstart + nadded),
+                            np.arange(0, nstart + nadded)))
+    store = TrackPoints.trackstore(xy[:nstart], info[:nstart],
+                                   np.arange(0, nstart), np.arange(0, nstart),
+                                   ['X', 'Y'], ['T', 'D'])
+    for k in range(nstart, nstart + nadded):
+        store.append(xy[k:k+1], info[k:k+1], [k], [k])
+    store.assign([0, 1], xy[[1, 0]], info[[1, 0]], [100, 101])
+
+    if verbose:
+        print(store.points)
+
+    # Test that all points were kept, in order
+    out1 = (len(store) == nstart + nadded) & np.all(
+            store.points['names'].values == np.arange(0, nstart + nadded))
+    # Test that assign changed values in place but not names
+    out2 = np.all(store.points[['X', 'Y']].values[:2] == xy[[1, 0]]) & (
+            store.points['inputInds'].values[:2].tolist() == [100, 101])
+    # Test that view matches arrays
+    out3 = np.all(store.points[['X', 'Y']].values[2:] == xy[2:]) & np.all(
+            store.points[['T', 'D']].values[2:] == info[2:])
+    return out1, out2, out3
+
+
+def test_closegaps(npoints=10, nframes=8, shift=0.02, verbose=False):
+    """
+    Test TrackPoints.closegaps: one point is missing for two frames and then
+    reappears shifted by more than the link radius used by linkpoints, so
+    linkpoints gives it a new blobID; closegaps should join the two tracks.
+
+    Returns true if linkpoints split the point into two tracks, if closegaps
+    joins them (column D is a persistant index), and if closegaps does not
+    join tracks of different points.
+    """
+    xy = 0.1*np.arange(0, npoints)[:, None] + np.zeros((npoints, 2))
+    frames = []
+    for t in range(nframes):
+        xyt = xy.copy()
+        keep = np.ones(npoints, dtype=bool)
+        if t in (3, 4):
+            keep[0] = False
+        if t >= 5:
+            xyt[0, :] += shift
+        frames.append(pandas.DataFrame({
+            'Time': np.full(keep.sum(), 60*t), 'X': xyt[keep, 0],
+            'Y': xyt[keep, 1], 'Major': np.ones(keep.sum()),
+            'D': np.arange(0, npoints)[keep],
+            'ImGroup': np.zeros(keep.sum(), dtype=int)}))
+    df = pandas.concat(frames, ignore_index=True)
+    df = TrackPoints.linkpoints(df, LinkRadius=shift/2)
+    out1 = df[df['D'] == 0]['blobID'].nunique() == 2
+
+    df = TrackPoints.closegaps(df, MaxGap=2, MaxDist=0.1)
+    if verbose:
+        print(df)
+    ids = df.groupby('D')['blobID']
+    out2 = np.all(ids.nunique().values == 1)
+    out3 = len(set(df['blobID'].values)) == npoints
+    return out1, out2, out3
+
+
+def test_predict(nside=5, spacing=0.1, shift=0.07, verbose=False):
+    """
+    Test motion prediction: points on a grid all shift by the same vector,
+    larger than half the grid spacing, so nearest neighbours are swapped
+    without prediction.
+
+    Returns true if linking without prediction mislinks points, and if
+    linking with predict='drift' and with predict='velocity' links every
+    point to itself (column D is a persistant index).
+    """
+    gx, gy = np.meshgrid(np.arange(nside), np.arange(nside))
+    xy = spacing*np.column_stack((gx.ravel(), gy.ravel()))
+    npoints = len(xy)
+    frames = []
+    for t in range(4):
+        frames.append(pandas.DataFrame({
+            'Time': np.full(npoints, 60*t), 'X': xy[:, 0] + t*shift,
+            'Y': xy[:, 1] + 0.5*t*shift, 'Major': np.ones(npoints),
+            'D': np.arange(0, npoints),
+            'ImGroup': np.zeros(npoints, dtype=int)}))
+    df = pandas.concat(frames, ignore_index=True)
+
+    plain = TrackPoints.linkpoints(df.copy(), Matcher='assignment',
+                                   LinkRadius=spacing)
+    drift = TrackPoints.linkpoints(df.copy(), Matcher='assignment',
+                                   LinkRadius=spacing/2, Predict='drift')
+    velocity = TrackPoints.linkpoints(df.copy(), LinkRadius=spacing/2,
+                                      Predict='velocity')
+    if verbose:
+        print(drift)
+
+    out1 = np.any(plain.groupby('D')['blobID'].nunique().values > 1)
+    out2 = np.all(drift.groupby('D')['blobID'].nunique().values == 1) & (
+            drift['blobID'].nunique() == npoints)
+    out3 = np.all(velocity.groupby('D')['blobID'].nunique().values == 1) & (
+            velocity['blobID'].nunique() == npoints)
+    return out1, out2, out3
+
+
 test_varypositions(nstart=3, ngained=2, relativenoise=0.1, verbose=True)
@@ -10,20 +10,145 @@ might be helpful to rewrite for more general columns, and potentially used
 more than the x-y column similarity to match points (e.g. weighted sum of
 squares of another quantifier (e.g. diameter)).
 
-Storing values in pointcollection.points as dataframe might also make indexing
-easier...
+Points in a pointcollection are stored in a trackstore (preallocated numpy
+arrays, updated in place); pointcollection.points gives a dataframe view of
+them.
 
 @author: Michelangelo
 """
 
 import pandas
 import numpy as np
-from copy import deepcopy
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+
+class trackstore:
+    """
+    Compact, array-backed store of point (track) states for pointcollection.
+
+    Data columns (coordinates), info columns, names and input indices of
+    points are kept in preallocated numpy arrays, with one row per point.
+    Matched points are updated in place and new points are added at the end;
+    the arrays grow geometrically (capacity doubles) when full, so adding a
+    point takes constant time on average.
+
+    Attributes :
+    ------------
+    datacols, infocols : lists of str
+        names of data and info columns
+    data : 2D float numpy.array, capacity x len(datacols)
+    info : 2D numpy.array, capacity x len(infocols) (float if the info columns
+        are numeric, otherwise object)
+    inputinds : 1D numpy.array, index values of points in the input dataframe
+    names : 1D int numpy.array, numeric names of points
+    velocity : 2D float numpy.array, capacity x len(datacols)
+        estimated change in data columns per frame (used by pointcollection
+        for motion prediction; zero for new points)
+    n : int, number of points in the store (rows beyond n are unused)
+    """
+    __slots__ = ('datacols', 'infocols', 'data', 'info', 'inputinds',
+                 'names', 'velocity', 'n', 'view')
+
+    def __init__(self, datavals, infovals, inputinds, names, datacols,
+                 infocols):
+        """
+        Parameters :
+        ------------
+        datavals : 2D array, one column per datacol, one row per point
+        infovals : 2D array, one column per infocol, one row per point
+        inputinds : 1D array, index values of points in input dataframe
+        names : 1D array of ints, names of points
+        datacols, infocols : lists of str
+        """
+        self.datacols = list(datacols)
+        self.infocols = list(infocols)
+        n = len(names)
+        infovals = np.asarray(infovals)
+        if infovals.dtype.kind in 'biuf':
+            infodtype = float
+        else:
+            infodtype = object
+        inputinds = np.asarray(inputinds)
+
+        self.data = np.empty((n, len(self.datacols)), dtype=float)
+        self.info = np.empty((n, len(self.infocols)), dtype=infodtype)
+        self.inputinds = np.empty(n, dtype=inputinds.dtype)
+        self.names = np.empty(n, dtype=np.int64)
+        self.velocity = np.empty((n, len(self.datacols)), dtype=float)
+        self.n = 0
+        self.view = None
+        self.append(datavals, infovals, inputinds, names)
+
+    def __len__(self):
+        return self.n
+
+    def reserve(self, nrows):
+        """
+        Make room for at least nrows points, at least doubling capacity
+        whenever the arrays have to grow.
+        """
+        capacity = len(self.names)
+        if nrows <= capacity:
+            return
+        capacity = max(nrows, 2*capacity, 16)
+        for attr in ('data', 'info', 'inputinds', 'names', 'velocity'):
+            old = getattr(self, attr)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.n] = old[:self.n]
+            setattr(self, attr, new)
+
+    def append(self, datavals, infovals, inputinds, names):
+        """
+        Add points at the end of the store (arguments as for __init__).
+        """
+        nnew = len(names)
+        self.reserve(self.n + nnew)
+        rows = slice(self.n, self.n + nnew)
+        self.data[rows] = np.reshape(datavals, (nnew, len(self.datacols)))
+        self.info[rows] = np.reshape(infovals, (nnew, len(self.infocols)))
+        self.inputinds[rows] = inputinds
+        self.names[rows] = names
+        self.velocity[rows] = 0
+        self.n += nnew
+        self.view = None
+
+    def assign(self, rows, datavals, infovals, inputinds):
+        """
+        Overwrite data, info and input indices of existing points (rows) in
+        place; names are kept.
+        """
+        self.data[rows] = datavals
+        self.info[rows] = infovals
+        self.inputinds[rows] = inputinds
+        self.view = None
+
+    @property
+    def points(self):
+        """
+        Dataframe of points, with columns datacols, infocols, 'inputInds' and
+        'names'. Built when first needed after the store changes; changes to
+        the dataframe are not written back to the store.
+        """
+        if self.view is None:
+            n = self.n
+            view = pandas.DataFrame(self.data[:n].copy(),
+                                    columns=self.datacols,
+                                    index=self.inputinds[:n].copy())
+            for k, col in enumerate(self.infocols):
+                view[col] = self.info[:n, k].copy()
+            view['inputInds'] = self.inputinds[:n].copy()
+            view['names'] = self.names[:n].copy()
+            self.view = view
+        return self.view
 
 
 class pointcollection:
     def __init__(self, df, datacols=['X', 'Y'], infocols=['T', 'D'],
-                 firstpointname=0, weights=[1, 1]):
+                 firstpointname=0, weights=[1, 1], matcher='greedy',
+                 maxdist=None, linkradius=None, predict=None, smoothing=0.5):
         """
         Initialize point collection
 
@@ -40,14 +165,36 @@ class pointcollection:
         weights : list of ints, same number of elements as datacols
             weighting to apply to columns for matching points when doing sum
             of squares (e.g. 1*(deltaX**2)+1*(deltaY**2))
+        matcher : str
+            'greedy' (default) or 'assignment'; method used by
+            pointcollection.matchpoints to link points (see matchpoints).
+        maxdist : float or None
+            Gating distance (in weighted data column units) for the
+            'assignment' matcher: points further apart than maxdist are never
+            linked, and are treated as lost/new instead.
+        linkradius : float or None
+            Maximum link radius (in weighted data column units). If given,
+            pointcollection.matchpoints only considers pairs of points within
+            linkradius of each other, found with a KD-tree, instead of
+            calculating distances between all pairs of points.
+        predict : str or None
+            Motion prediction used by pointcollection.matchpoints: None (match
+            against last positions), 'drift' (shift all points by the global
+            drift between frames; see estimatedrift) or 'velocity' (drift
+            plus each point's own velocity, estimated from its recent
+            history by pointcollection.update).
+        smoothing : float, 0<smoothing<=1
+            Weight of the latest displacement when updating velocities
+            (exponential smoothing; 1 uses only the last displacement).
 
+        pointcollection.store : trackstore holding the points
         pointcollection.points : pandas dataframe with columns datacols and
             infocols (see above), 'names' (numeric names for points), and
             'inputInds' (index from dataframe used
             to create pointcollection; this column gets updated by
             pointcollection.update(newpointcollection) to match inputInds in
             newpointcollection for all points that match between the two
-            pointcollections).
+            pointcollections). This is a view of pointcollection.store.
         pointcollection.cols : dict of strings
             Contains names of datacolumns and infocolumns
         pointcollection.weights = list of weights to apply to datacolumns when
@@ -55,14 +202,81 @@ class pointcollection:
         pointcollection.nextpointname : int
             starting point for naming new points added to
             pointcollection.points upon pointcollection.update.
+        pointcollection.matcher, pointcollection.maxdist,
+        pointcollection.linkradius, pointcollection.predict,
+        pointcollection.smoothing : defaults used by
+            pointcollection.matchpoints and pointcollection.update.
+        pointcollection.lastdrift : numpy.array
+            global drift (in data column units) estimated by the last call to
+            pointcollection.matchpoints (zeros without motion prediction).
         """
         self.cols = {"datacolumns": datacols, "infocolumns": infocols}
         self.weights = weights
+        self.matcher = matcher
+        self.maxdist = maxdist
+        self.linkradius = linkradius
+        self.predict = predict
+        self.smoothing = smoothing
+        self.lastdrift = np.zeros(len(datacols))
         self.nextpointname = firstpointname + len(df.values)
 
-        self.points = deepcopy(df[datacols + infocols])
-        self.points['inputInds'] = np.array(df.index)
-        self.points['names'] = np.arange(firstpointname, self.nextpointname)
+        self.store = trackstore(
+                df[datacols].values, df[infocols].values, np.array(df.index),
+                np.arange(firstpointname, self.nextpointname), datacols,
+                infocols)
+
+    @classmethod
+    def fromarrays(cls, datavals, infovals, inputinds, datacols=['X', 'Y'],
+                   infocols=['T', 'D'], firstpointname=0, weights=[1, 1],
+                   matcher='greedy', maxdist=None, linkradius=None,
+                   predict=None, smoothing=0.5):
+        """
+        Create pointcollection from arrays of values instead of a dataframe
+        (e.g. slices of arrays taken once from a large dataframe, as in
+        linkpoints), without creating a dataframe.
+
+        Parameters
+        ----------
+        datavals : 2D numpy.array
+            one column per column in datacols, one row per point
+        infovals : 2D numpy.array
+            one column per column in infocols, one row per point
+        inputinds : 1D array
+            index values (e.g. from the original dataframe) for 'inputInds'
+        datacols, infocols, firstpointname, weights, matcher, maxdist,
+        linkradius, predict, smoothing : see pointcollection.__init__
+        """
+        self = cls.__new__(cls)
+        self.cols = {"datacolumns": datacols, "infocolumns": infocols}
+        self.weights = weights
+        self.matcher = matcher
+        self.maxdist = maxdist
+        self.linkradius = linkradius
+        self.predict = predict
+        self.smoothing = smoothing
+        self.lastdrift = np.zeros(len(datacols))
+        self.nextpointname = firstpointname + len(inputinds)
+
+        self.store = trackstore(
+                datavals, infovals, inputinds,
+                np.arange(firstpointname, self.nextpointname), datacols,
+                infocols)
+        return self
+
+    @property
+    def points(self):
+        """
+        Dataframe view of points in pointcollection.store (see trackstore).
+        """
+        return self.store.points
+
+    @points.setter
+    def points(self, df):
+        self.store = trackstore(
+                df[self.cols['datacolumns']].values,
+                df[self.cols['infocolumns']].values, df['inputInds'].values,
+                df['names'].values, self.cols['datacolumns'],
+                self.cols['infocolumns'])
 
     @staticmethod
     def FlatIndsToRowCol(q, datashape):
@@ -201,20 +415,281 @@ class pointcollection:
 
         return {"matched": match, "conflicts": conflicts}
 
-    def matchpoints(self, newpoints):
+    @staticmethod
+    def assignmatch(sqrdists, maxsqrdist=None):
+        """
+        Link old points (rows of sqrdists) to new points (columns of sqrdists)
+        so that the sum of squared distances between linked points is as small
+        as possible, by solving the rectangular linear assignment problem.
+
+        Without a gate (maxsqrdist=None), min(#rows, #columns) pairs are linked,
+        as with the greedy matcher. With a gate, pairs further apart than
+        maxsqrdist are never linked, and leaving a pair unlinked (one point
+        lost, one point new) costs maxsqrdist, so a pair is only linked when
+        that lowers the total cost. This is done by padding the cost matrix
+        with one dummy column per old point (cost of losing it) and one dummy
+        row per new point (cost of it being new).
+
+        Parameters :
+        ------------
+        sqrdists : 2D numpy.array
+            squared distances; rows are old points, columns new points
+        maxsqrdist : float or None
+            square of the gating distance
+
+        Returns :
+        ---------
+        tuple of two int arrays : row and column indices of linked pairs
+        """
+        nold, nnew = sqrdists.shape
+        if (nold == 0) or (nnew == 0):
+            return np.array([], dtype=int), np.array([], dtype=int)
+        if maxsqrdist is None:
+            return linear_sum_assignment(sqrdists)
+
+        # Cost of leaving one point unlinked: half the cost of a pair at the
+        # gate, so a link is kept whenever its squared distance <= maxsqrdist.
+        unlinkcost = maxsqrdist/2
+        # Forbidden entries get a finite cost (older versions of scipy don't
+        # accept inf) larger than that of leaving every point unlinked.
+        forbidden = (nold + nnew + 1)*(unlinkcost + 1)
+        cost = np.full((nold + nnew, nnew + nold), forbidden)
+        cost[:nold, :nnew] = np.where(sqrdists <= maxsqrdist, sqrdists,
+                                      forbidden)
+        cost[np.arange(nold), nnew + np.arange(nold)] = unlinkcost
+        cost[nold + np.arange(nnew), np.arange(nnew)] = unlinkcost
+        # Dummy rows can always take the dummy columns left over by links.
+        cost[nold:, nnew:] = 0
+
+        rowinds, colinds = linear_sum_assignment(cost)
+        linked = (rowinds < nold) & (colinds < nnew)
+        return rowinds[linked], colinds[linked]
+
+    @staticmethod
+    def nearestconflicts(sqrdists, matchRCs):
+        """
+        For the 'assignment' matcher: find linked old points whose nearest new
+        point is not the point they are linked to.
+
+        Returns :
+        ---------
+        tuple (length 2) : row indices of those old points, and column indices
+        of their nearest new points (same format as FlatIndsToRowCol).
+        """
+        rows = np.array(matchRCs[0], dtype=int)
+        if len(rows) == 0:
+            return [], []
+        nearest = sqrdists[rows, :].argmin(axis=1)
+        conflicted = nearest != np.array(matchRCs[1], dtype=int)
+        return rows[conflicted].tolist(), nearest[conflicted].tolist()
+
+    @staticmethod
+    def estimatedrift(olddata, newdata, weights, niter=3):
+        """
+        Estimate global drift (e.g. whole ribbon moving) between old and new
+        points. Starts from the shift in median position of all points, then
+        niter times takes the median displacement from each (shifted) old
+        point to its nearest new point, which is robust to lost and new points
+        and to a few points moving on their own.
+
+        Parameters :
+        ------------
+        olddata, newdata : 2D numpy.array
+            data columns (not weighted) of old and new points
+        weights : list
+            weights of data columns (used to find nearest points)
+        niter : int
+
+        Returns :
+        ---------
+        1D numpy.array : drift in data column units
+        """
+        if (len(olddata) == 0) or (len(newdata) == 0):
+            return np.zeros(olddata.shape[1])
+        w = np.array([weights], dtype=float)
+        drift = np.median(newdata, axis=0) - np.median(olddata, axis=0)
+        tree = cKDTree(newdata*w)
+        for k in range(niter):
+            nearest = tree.query((olddata + drift)*w)[1]
+            drift = np.median(newdata[nearest, :] - olddata, axis=0)
+        return drift
+
+    @staticmethod
+    def candidatepairs(olddata, newdata, radius):
+        """
+        Find all pairs of old and new points within 'radius' of each other,
+        using KD-trees, so memory and time grow with the number of neighbouring
+        pairs rather than with (#old points)*(#new points).
+
+        Parameters :
+        ------------
+        olddata, newdata : 2D numpy.array
+            weighted data columns of old and new points (one row per point)
+        radius : float
+            maximum distance between points in a pair
+
+        Returns :
+        ---------
+        tuple of three arrays : row (old point) indices, column (new point)
+        indices, and squared distances of candidate pairs.
+        """
+        if (len(olddata) == 0) or (len(newdata) == 0):
+            return (np.array([], dtype=int), np.array([], dtype=int),
+                    np.array([], dtype=float))
+        neighbours = cKDTree(olddata).query_ball_tree(cKDTree(newdata),
+                                                      radius)
+        counts = np.array([len(q) for q in neighbours], dtype=int)
+        rowinds = np.repeat(np.arange(len(neighbours)), counts)
+        colinds = np.array([c for q in neighbours for c in q], dtype=int)
+        sqrdists = ((olddata[rowinds, :] - newdata[colinds, :])**2).sum(axis=1)
+        return rowinds, colinds, sqrdists
+
+    @classmethod
+    def assignpairs(cls, rowinds, colinds, costs, nrows, ncols, maxcost):
+        """
+        Solve the gated assignment problem (see assignmatch) when only some
+        pairs of rows and columns can be linked. Rows & columns are grouped
+        into connected components of the bipartite graph of candidate pairs,
+        and a small dense problem is solved per component, so time grows with
+        the number of candidate pairs rather than with nrows*ncols.
+
+        Parameters :
+        ------------
+        rowinds, colinds : 1D int arrays
+            row & column indices of candidate pairs
+        costs : 1D array
+            cost of linking each candidate pair
+        nrows, ncols : int
+            number of rows & columns
+        maxcost : float
+            gate (see assignmatch: maxsqrdist)
+
+        Returns :
+        ---------
+        1D int array : indices (in rowinds/colinds/costs) of linked pairs
+        """
+        # Number columns after rows to make one graph.
+        graph = coo_matrix((np.ones(len(rowinds)), (rowinds, nrows + colinds)),
+                           shape=(nrows + ncols, nrows + ncols))
+        ncomp, complabels = connected_components(graph, directed=False)
+        pairorder = np.argsort(complabels[rowinds], kind='mergesort')
+        bounds = np.searchsorted(complabels[rowinds][pairorder],
+                                 np.arange(ncomp + 1))
+        linked = []
+        for comp in range(ncomp):
+            pairs = pairorder[bounds[comp]:bounds[comp+1]]
+            if len(pairs) == 0:
+                continue
+            comprows, rowpos = np.unique(rowinds[pairs], return_inverse=True)
+            compcols, colpos = np.unique(colinds[pairs], return_inverse=True)
+            # Pairs that are not candidates are never linked.
+            compcosts = np.full((len(comprows), len(compcols)), np.inf)
+            compcosts[rowpos, colpos] = costs[pairs]
+            pairind = np.full(compcosts.shape, -1, dtype=int)
+            pairind[rowpos, colpos] = pairs
+            r, c = cls.assignmatch(compcosts, maxcost)
+            linked += pairind[r, c].tolist()
+        return np.array(linked, dtype=int)
+
+    def sparsematch(self, olddata, newdata, matcher, maxdist, linkradius):
+        """
+        Match points using only candidate pairs within linkradius (see
+        candidatepairs); called by matchpoints when linkradius is set.
+
+        matcher='greedy': link candidate pairs in order of increasing squared
+        distance, skipping pairs in which either point is already linked.
+        matcher='assignment': solve the assignment problem (see assignmatch)
+        separately for each connected group of candidate pairs, gated at
+        linkradius (or maxdist, if smaller).
+
+        Returns :
+        ---------
+        dict : same format as matchpoints
+        """
+        nold, nnew = len(olddata), len(newdata)
+        rowinds, colinds, sqrdists = self.candidatepairs(olddata, newdata,
+                                                         linkradius)
+        if matcher == 'greedy':
+            order = np.argsort(sqrdists, kind='mergesort')
+            rowused = np.zeros(nold, dtype=bool)
+            colused = np.zeros(nnew, dtype=bool)
+            linked = []
+            for k in order:
+                if not (rowused[rowinds[k]] or colused[colinds[k]]):
+                    rowused[rowinds[k]] = True
+                    colused[colinds[k]] = True
+                    linked.append(k)
+            linked = np.array(linked, dtype=int)
+        else:
+            maxsqrdist = linkradius**2
+            if maxdist is not None:
+                maxsqrdist = min(maxsqrdist, maxdist**2)
+            linked = self.assignpairs(rowinds, colinds, sqrdists, nold, nnew,
+                                      maxsqrdist)
+
+        matchRCs = (rowinds[linked].tolist(), colinds[linked].tolist())
+        newCs = ([], sorted(set(range(0, nnew)).difference(set(matchRCs[1]))))
+        lostRs = (sorted(set(range(0, nold)).difference(set(matchRCs[0]))), [])
+
+        # Conflicts: linked old points whose nearest candidate is another
+        # new point.
+        nearestorder = np.lexsort((sqrdists, rowinds))
+        firstofrow = np.ones(len(nearestorder), dtype=bool)
+        firstofrow[1:] = np.diff(rowinds[nearestorder]) != 0
+        nearestcol = np.full(nold, -1, dtype=int)
+        nearestcol[rowinds[nearestorder[firstofrow]]] = colinds[
+                                                nearestorder[firstofrow]]
+        linkedrows = rowinds[linked]
+        conflicted = nearestcol[linkedrows] != colinds[linked]
+        conflictRCs = (linkedrows[conflicted].tolist(),
+                       nearestcol[linkedrows[conflicted]].tolist())
+
+        return {'matched': matchRCs, 'new': newCs, 'lost': lostRs,
+                'conflicts': conflictRCs, 'sqrdists': sqrdists[linked]}
+
+    def matchpoints(self, newpoints, matcher=None, maxdist=None,
+                    linkradius=None, predict=None):
         """
         Match points described in dataframe to points in point collection.
         Dataframe must matches format of dataframe used to generate
         pointcollection.
 
-        Uses greedy algorithm to link points in pointcollection and newpoints
+        matcher='greedy': uses greedy algorithm to link points in
+        pointcollection and newpoints.
         The way I am implementing this ignores possiblities of ties (they
         will be rare in this application) but they could be dealt with either
         by checking for them, or by repeating with noise added, or ...
 
+        matcher='assignment': links points to minimize the sum of squared
+        distances over all linked pairs (see assignmatch), with optional gating
+        distance maxdist for lost and new points. Much faster than the greedy
+        matcher for more than a few dozen points.
+
+        If linkradius is set, only pairs of points within linkradius of each
+        other are considered (see sparsematch); the greedy matcher then links
+        candidate pairs in order of distance, without the conflict checks
+        below. Points with no new point within linkradius are lost.
+
+        If predict is set, new points are matched against predicted positions
+        of old points (shifted by global drift, and with predict='velocity'
+        by each point's velocity), rather than their last positions, so
+        points can be tracked with a small linkradius while the whole sequence
+        drifts. The drift is stored in self.lastdrift.
+
         Parameters
         -----------
         newpoints : pointcollection
+        matcher : str or None
+            'greedy' or 'assignment'; if None, uses self.matcher
+        maxdist : float or None
+            gating distance for 'assignment' matcher; if None, uses
+            self.maxdist (which may also be None: no gating)
+        linkradius : float or None
+            maximum link radius; if None, uses self.linkradius (which may also
+            be None: all pairs of points are considered)
+        predict : str or None
+            None, 'drift' or 'velocity'; if None, uses self.predict (see
+            pointcollection.__init__)
 
         Returns
         -------
@@ -236,16 +711,43 @@ class pointcollection:
             'sqrdists' : squared distances between centers of each pair of
                 matched points.
         """
+        if matcher is None:
+            matcher = self.matcher
+        if maxdist is None:
+            maxdist = self.maxdist
+        if linkradius is None:
+            linkradius = self.linkradius
+        if predict is None:
+            predict = self.predict
+        if matcher not in ('greedy', 'assignment'):
+            raise ValueError("matcher must be 'greedy' or 'assignment'")
+        if predict not in (None, 'drift', 'velocity'):
+            raise ValueError("predict must be None, 'drift' or 'velocity'")
+
         # Calculate array of squared distances btwn pointcollection &
-        # newpoints. For large arrays, it might be better not to calculate all
-        # elements, but for arrays of expected size it should be faster.
-        if self.points.columns.tolist() != newpoints.points.columns.tolist():
+        # newpoints. For large arrays, it is better not to calculate all
+        # elements (set linkradius to only use neighbouring pairs), but for
+        # arrays of expected size it should be faster.
+        if self.cols != newpoints.cols:
             raise ValueError("Old & new pointcollection columns don't match")
 
-        olddata = (self.points[self.cols['datacolumns']].values)*np.array(
-                                                        [self.weights])
-        newdata = (newpoints.points[self.cols['datacolumns']].values)*np.array(
-                                                        [self.weights])
+        oldvals = self.store.data[:len(self.store)]
+        newvals = newpoints.store.data[:len(newpoints.store)]
+        # Predicted positions of old points.
+        self.lastdrift = np.zeros(oldvals.shape[1])
+        if predict == 'velocity':
+            oldvals = oldvals + self.store.velocity[:len(self.store)]
+        if predict is not None:
+            self.lastdrift = self.estimatedrift(oldvals, newvals,
+                                                self.weights)
+            oldvals = oldvals + self.lastdrift
+
+        olddata = oldvals*np.array([self.weights])
+        newdata = newvals*np.array([self.weights])
+        if linkradius is not None:
+            return self.sparsematch(olddata, newdata, matcher, maxdist,
+                                    linkradius)
+
         for c in range(0, olddata.shape[1]):
             # Using numpy's None indexing to expand array dimensions to make
             # a column vector from olddata and a row vector from newdata. Numpy
@@ -256,6 +758,18 @@ class pointcollection:
                 sqrdists += (olddata[:, c, None]-newdata[None, :, c])**2
 #        print(sqrdists)
 
+        if matcher == 'assignment':
+            rowinds, colinds = self.assignmatch(
+                sqrdists, None if maxdist is None else maxdist**2)
+            matchRCs = (rowinds.tolist(), colinds.tolist())
+            newCs = ([], sorted(set(
+                range(0, sqrdists.shape[1])).difference(set(matchRCs[1]))))
+            lostRs = (sorted(set(
+                range(0, sqrdists.shape[0])).difference(set(matchRCs[0]))), [])
+            return {'matched': matchRCs, 'new': newCs, 'lost': lostRs,
+                    'conflicts': self.nearestconflicts(sqrdists, matchRCs),
+                    'sqrdists': sqrdists[matchRCs]}
+
         rankinds = sqrdists.argsort(axis=None).tolist()
 
         # Starting point of matching: link pair of points with shortest
@@ -300,44 +814,63 @@ class pointcollection:
 
         newpoints : pointcollection object
         verbose : boolean
+
+        Returns :
+        ---------
+        numpy.array : names given to the points in newpoints (in the order of
+            newpoints.points)
         """
         # Find point matches.
         matchdict = self.matchpoints(newpoints)
         if verbose:
             print(matchdict)
 
-        # deepcopy newpoints.points to avoid changing original
-        newptsdfcopy = deepcopy(newpoints.points)
+        newstore = newpoints.store
+        oldrows = np.array(matchdict['matched'][0], dtype=int)
+        matchedrows = np.array(matchdict['matched'][1], dtype=int)
+        newrows = np.array(matchdict['new'][1], dtype=int)
 
-        # Get position index of 'names' column; raise error if columns do not
-        # match between self and new pointcollections
-        ptcols = self.points.columns.tolist()
-        if ptcols != newptsdfcopy.columns.tolist():
-            raise ValueError("Old & new pointcollection columns don't match")
+        # With velocity prediction, update velocities of matched points by
+        # exponential smoothing of their displacement (less global drift).
+        if self.predict == 'velocity':
+            displacement = newstore.data[matchedrows] - self.store.data[
+                                                    oldrows] - self.lastdrift
+            self.store.velocity[oldrows] = (
+                    (1 - self.smoothing)*self.store.velocity[oldrows] +
+                    self.smoothing*displacement)
 
-        namepos = ptcols.index('names')
-        # For matched points, change name of points in newptsdfcopy. Can't do
-        # all at once without difficult to identify error (probably due to
-        # modifying df as it goes through the list.
-        for spts, npts in zip(
-                            matchdict['matched'][0], matchdict['matched'][1]):
-            newptsdfcopy.iloc[npts, namepos] = self.points.iloc[spts, namepos]
+        # Matched points keep their names, and take data, info and input
+        # indices from newpoints (in place); lost points are left as they are.
+        newnames = np.empty(len(newstore), dtype=np.int64)
+        newnames[matchedrows] = self.store.names[oldrows]
+        self.store.assign(oldrows, newstore.data[matchedrows],
+                          newstore.info[matchedrows],
+                          newstore.inputinds[matchedrows])
 
-        # Rename new points in newptsdfcopy and update nextpointname
-        for npt in matchdict['new'][1]:
-            newptsdfcopy.iloc[npt, namepos] = self.nextpointname
-            self.nextpointname += 1
+        # Name new points, update nextpointname, and add them to the store.
+        newnames[newrows] = np.arange(self.nextpointname,
+                                      self.nextpointname + len(newrows))
+        self.nextpointname += len(newrows)
+        self.store.append(newstore.data[newrows], newstore.info[newrows],
+                          newstore.inputinds[newrows], newnames[newrows])
 
-        # Use concatenate to add rows from lost points in old points df.
-        self.points = pandas.concat((
-                    self.points.iloc[matchdict['lost'][0], :], newptsdfcopy))
+        return newnames
 
 
 def linkpoints(df, DataColumns=['X', 'Y'], InfoColumns=['Time', 'Major'],
                GroupNameColumn='ImGroup', BlobNameColumn='blobID', name1=0,
-               ColWeights=[1, 1]):
+               ColWeights=[1, 1], Matcher='greedy', MaxDist=None,
+               LinkRadius=None, Predict=None):
     """
     Link points in data frame df
+
+    Rows are sorted once by image group and frame (InfoColumns[0]); each
+    frame is then a contiguous range of rows in the sorted arrays, so no
+    dataframe is masked or copied per frame, and blob names for a whole frame
+    are written in one step.
+
+    Matcher, MaxDist, LinkRadius and Predict are passed to pointcollection as
+    matcher, maxdist, linkradius and predict (see pointcollection.matchpoints).
     """
     if type(name1) != int:
         YorN = input(
@@ -347,43 +880,165 @@ def linkpoints(df, DataColumns=['X', 'Y'], InfoColumns=['Time', 'Major'],
         else:
             name1 = 0
 
-    newevent = True
-
     gnc = GroupNameColumn  # Column containing group names for images
     fc = InfoColumns[0]  # Column containing frame info (e.g. time of shot)
 
     bnc = BlobNameColumn  # Column to contain names for points/blobs
-    # Initialize column for point/blob names: using None made assignment crash
-    df[bnc] = -float('inf')
+
+    # Pull values out of df once, and sort rows by group, then by frame.
+    groups = df[gnc].values
+    frames = df[fc].values
+    order = np.lexsort((frames, groups))
+    datavals = df[DataColumns].values[order, :]
+    infovals = df[InfoColumns].values[order, :]
+    inputinds = np.array(df.index)[order]
+    sgroups = groups[order]
+    sframes = frames[order]
+
+    # Row ranges [starts[k], stops[k]) of each (group, frame) in sorted rows;
+    # groupstarts[g] is the position in starts of the first frame of group g.
+    newframe = np.ones(len(order), dtype=bool)
+    newframe[1:] = (sgroups[1:] != sgroups[:-1]) | (sframes[1:] != sframes[:-1])
+    starts = np.flatnonzero(newframe)
+    stops = np.append(starts[1:], len(order))
+    newgroup = np.ones(len(starts), dtype=bool)
+    newgroup[1:] = sgroups[starts[1:]] != sgroups[starts[:-1]]
+    groupstarts = np.append(np.flatnonzero(newgroup), len(starts))
+
+    # Initialize array for point/blob names: using None made assignment crash
+    blobnames = np.full(len(order), -float('inf'))
+
+    def framepoints(k, firstpointname):
+        rows = slice(starts[k], stops[k])
+        return pointcollection.fromarrays(
+            datavals[rows, :], infovals[rows, :], inputinds[rows],
+            datacols=DataColumns, infocols=InfoColumns,
+            firstpointname=firstpointname, weights=ColWeights,
+            matcher=Matcher, maxdist=MaxDist, linkradius=LinkRadius,
+            predict=Predict)
 
     p1 = name1  # Initialize firs point/blob name
-    for imgroup in sorted(set(df[gnc].values)):
-        f1 = df[df[gnc] == imgroup].loc[:, fc].values[0]
-        dfinit = df[df[fc] == f1]
-        initialpoints = pointcollection(dfinit, datacols=DataColumns,
-                                        infocols=InfoColumns,
-                                        firstpointname=p1, weights=ColWeights)
-        # Turns out Python sets aren't sorted even though they print in order,
-        # so have to sort here to go through images in order.
-        for fnew in sorted(set(df[df[gnc] == imgroup].loc[:, fc])):
-            dfnew = df[df[fc] == fnew]
-            newpoints = pointcollection(dfnew, datacols=DataColumns,
-                                        infocols=InfoColumns,
-                                        firstpointname=p1, weights=ColWeights)
-            initialpoints.update(newpoints)
-            for k in df[df[fc] == fnew].index:
-                #try:
-                df.loc[k, bnc] = initialpoints.points[initialpoints.points[
-                                        'inputInds'] == k].names.values
-#                except ValueError:
-#                    if newevent:
-#                        newevent = False
-#                        print(fc, '==', fnew, '; index=', k)
-#                        print("Points =", initialpoints.points)
-#                        print('New points=', newpoints.points)
-#                        print("df IDs =", df.loc[k, bnc])
-#                        break
-
-        p1 = max(initialpoints.points["names"]) + 1
+    for g in range(len(groupstarts) - 1):
+        groupframes = range(groupstarts[g], groupstarts[g+1])
+        # Start from the frame of the group's first row in df.
+        f1 = frames[np.flatnonzero(groups == sgroups[starts[groupframes[0]]]
+                                   )[0]]
+        k1 = [k for k in groupframes if sframes[starts[k]] == f1][0]
+        initialpoints = framepoints(k1, p1)
+        # Frames are already in order within the group.
+        for k in groupframes:
+            newnames = initialpoints.update(framepoints(k, p1))
+            blobnames[starts[k]:stops[k]] = newnames
+
+        p1 = initialpoints.nextpointname
+
+    # Write names back in df's row order.
+    df[bnc] = blobnames[np.argsort(order)]
+
+    return df
+
+
+def closegaps(df, MaxGap=2, DataColumns=['X', 'Y'], FrameColumn='Time',
+              SizeColumn='Major', GroupNameColumn='ImGroup',
+              BlobNameColumn='blobID', ColWeights=[1, 1], SizeWeight=1,
+              MaxDist=50):
+    """
+    Second linking pass, after linkpoints: join tracks (blobs named in
+    BlobNameColumn) that end, to tracks that start up to MaxGap frames later
+    (e.g. blob lost for a few frames, or moved too far to be linked frame to
+    frame), instead of joining them by hand.
+
+    Only the end of each track and the start of each track are compared, so
+    time grows with the number of tracks rather than with the number of
+    frames. Joins are chosen by solving the gated assignment problem (see
+    pointcollection.assignpairs) with cost, for the end of one track and the
+    start of another:
+        cost = nframes * (dX**2 + dY**2 + SizeWeight * dMajor**2)
+    where nframes is the number of frames from the end of the first track to
+    the start of the second (1 for consecutive frames), dX, dY are differences
+    in weighted DataColumns, and dMajor is the difference in SizeColumn. The
+    cost of a join must be <= MaxDist**2.
+
+    Parameters :
+    ------------
+    df : pandas dataframe, after linkpoints
+    MaxGap : int
+        maximum number of frames missing between two joined tracks
+    DataColumns, ColWeights : as in linkpoints
+    FrameColumn : str
+        column with frame info (e.g. time of shot)
+    SizeColumn : str
+        column with blob diameter
+    GroupNameColumn : str or None
+        tracks are only joined within image groups; if None, tracks can be
+        joined across the whole sequence
+    BlobNameColumn : str
+        column with names of blobs (tracks)
+    SizeWeight : float
+        weighting of squared difference in SizeColumn in cost
+    MaxDist : float
+        gate on cost (see above)
+
+    Returns :
+    ---------
+    df, with BlobNameColumn updated in place: each joined track takes the name
+    of the earlier track.
+    """
+    bnc = BlobNameColumn
+    if GroupNameColumn is None:
+        groups = np.zeros(len(df), dtype=int)
+    else:
+        groups = df[GroupNameColumn].values
+    frames = df[FrameColumn].values
+    blobs = df[bnc].values
+
+    # Sort rows by group & frame, and rank frames within each group.
+    order = np.lexsort((frames, groups))
+    sgroups = groups[order]
+    newframe = np.ones(len(order), dtype=bool)
+    newframe[1:] = (sgroups[1:] != sgroups[:-1]) | (
+                    frames[order][1:] != frames[order][:-1])
+    newgroup = np.ones(len(order), dtype=bool)
+    newgroup[1:] = sgroups[1:] != sgroups[:-1]
+    framecount = np.cumsum(newframe)
+    framerank = framecount - np.maximum.accumulate(
+                                        np.where(newgroup, framecount, 0))
+
+    # First (track start) and last (track end) rows of each blob.
+    sblobs = blobs[order]
+    names, firstpos = np.unique(sblobs, return_index=True)
+    lastpos = len(sblobs) - 1 - np.unique(sblobs[::-1],
+                                          return_index=True)[1]
+    startrows = order[firstpos]
+    endrows = order[lastpos]
+
+    # Positions of track ends & starts in weighted data & size space.
+    vals = np.column_stack((
+                df[DataColumns].values*np.array([ColWeights]),
+                (SizeWeight**0.5)*df[SizeColumn].values))
+    endpos = vals[endrows, :]
+    startpos = vals[startrows, :]
+    endrank = framerank[lastpos]
+    startrank = framerank[firstpos]
+
+    # Candidate joins: within MaxDist, same group, and starting 1 to
+    # MaxGap + 1 frames after the end.
+    rowinds, colinds, sqrdists = pointcollection.candidatepairs(
+                                                endpos, startpos, MaxDist)
+    nframes = startrank[colinds] - endrank[rowinds]
+    keep = (groups[endrows[rowinds]] == groups[startrows[colinds]]) & (
+            nframes >= 1) & (nframes <= MaxGap + 1)
+    rowinds, colinds = rowinds[keep], colinds[keep]
+    costs = nframes[keep]*sqrdists[keep]
+
+    linked = pointcollection.assignpairs(rowinds, colinds, costs, len(names),
+                                         len(names), MaxDist**2)
+
+    # Rename joined tracks, following chains of joins in order of start, so
+    # each track takes the name of the first track in its chain.
+    newnames = names.copy()
+    for k in linked[np.argsort(startrank[colinds[linked]], kind='mergesort')]:
+        newnames[colinds[k]] = newnames[rowinds[k]]
+    df[bnc] = newnames[np.searchsorted(names, blobs)]
 
     return df
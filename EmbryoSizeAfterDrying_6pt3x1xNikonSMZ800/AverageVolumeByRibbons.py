@@ -27,6 +27,8 @@ import os, sys
 lib_path = os.path.abspath('..')
 sys.path.append(lib_path)
 import hambits.utils as hu
+import hambits.volumes as hv
+import hambits.cache as hc
 
 umperpix = 0.548307783  # See BrightFieldVsObliqueImages.xlsx
 
@@ -48,16 +50,18 @@ consdata['SE_Volume'] = np.nan
 numrows = 10
 
 for curfile in consdata.index.values:
-    curdata = pandas.read_csv(os.path.join(mydir, mysubdir, curfile), sep='\t')
+    # Parsed files are cached (see hambits.cache).
+    curdata = hc.loadcsv(os.path.join(mydir, mysubdir, curfile), sep='\t')
     # Check that expected number of entries per
     if len(curdata) != numrows:
         print(curfile)
         raise SystemExit('Current file has unexpected number of rows')
 
-    # Calculate embryo radii (measurements are in pairs: max diameter and min
-    # diameter of each embryo, so Length from every other row, and divide by 4)
-    radii_pix = (curdata['Length'].iloc[0::2].values +
-                 curdata['Length'].iloc[1::2].values)/4
+    # Embryo diameters (measurements are in pairs: max diameter and min
+    # diameter of each embryo, so Length from every other row)
+    diameters = {'Feret': curdata['Length'].iloc[0::2].values,
+                 'MinFeret': curdata['Length'].iloc[1::2].values}
+    radii_pix = (diameters['Feret'] + diameters['MinFeret'])/4
     # Check that entries are not skipped:  so the x-y centers of each ROI
     # should be within 1 embryo radius.
     curdata['Xcent'] = curdata['BX']+curdata['Width']/2
@@ -69,9 +73,8 @@ for curfile in consdata.index.values:
         print(curfile, checkcent)
         raise SystemExit('Measurements not in pairs?')
 
-    # Calculate volume
-    radii_um = umperpix*radii_pix
-    volumes_um3 = (4*3.14159/3)*(radii_um**3)
+    # Calculate volume (sphere with mean diameter, as for CVR data)
+    volumes_um3 = hv.volume(diameters, 'FeretSphere', scale=umperpix)
     # Enter mean volume into consdata dataframe
     consdata.loc[curfile, 'Volume']=np.mean(volumes_um3)
     # Enter standard errors of mean volumes
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of generalized ESD tests (GeneralizedESD, BatchGeneralizedESD) in
+stats against direct (per-iteration) calculation.
+
+@author: Michelangelo
+"""
+
+import numpy as np
+
+import stats
+
+
+def directesd(MyData, MaxNumOutliers):
+    """
+    Generalized ESD iterations calculated directly: mean and standard
+    deviation of the remaining data are recalculated at each iteration.
+
+    Returns :
+    ---------
+    MaxRsInd, MaxRs : arrays (as in stats.GeneralizedESD)
+    """
+    MyData = np.array(MyData).astype(float)
+    MaxRsInd = np.full(MaxNumOutliers, np.nan)
+    MaxRs = np.full(MaxNumOutliers, np.nan)
+    for k in range(0, MaxNumOutliers):
+        Rs = abs(MyData - np.nanmean(MyData))/np.nanstd(MyData)
+        MaxRsInd[k] = np.nanargmax(Rs)
+        MaxRs[k] = Rs[int(MaxRsInd[k])]
+        MyData[int(MaxRsInd[k])] = np.nan
+    return MaxRsInd, MaxRs
+
+
+def grossoutlierdata(npoints=50, scale=1e-3, outlier=1e8, seed=0):
+    """
+    Normally distributed data (mean 1, standard deviation scale) with gross
+    outliers +/- outlier at indices 3 and 7.
+    """
+    mydata = np.random.RandomState(seed).normal(1, scale, npoints)
+    mydata[3] = outlier
+    mydata[7] = -outlier
+    return mydata
+
+
+def test_grossoutliers(MaxNumOutliers=5, verbose=False):
+    """
+    Test GeneralizedESD with gross outliers (removing them leaves running
+    sums dominated by rounding error unless they are recomputed).
+
+    Returns true if, for outliers +/- 1e6 and +/- 1e8, the maximum residuals
+    match direct calculation, and if only the gross outliers are flagged.
+    """
+    out1, out2 = True, True
+    for outlier in [1e6, 1e8]:
+        mydata = grossoutlierdata(outlier=outlier)
+        OutlierInds, IterVals = stats.GeneralizedESD(mydata, MaxNumOutliers)
+        MaxRsInd, MaxRs = directesd(mydata, MaxNumOutliers)
+        if verbose:
+            print(IterVals['MaxRs'])
+            print(MaxRs)
+        out1 &= np.allclose(IterVals['MaxRs'], MaxRs, rtol=1e-6) & (
+                np.all(IterVals['MaxRsInd'] == MaxRsInd))
+        out2 &= sorted(OutlierInds) == [3, 7]
+    return out1, out2
+
+
+def test_batchgrossoutliers(MaxNumOutliers=5, verbose=False):
+    """
+    Test BatchGeneralizedESD on columns with and without gross outliers.
+
+    Returns true if the maximum residuals of each column match direct
+    calculation, and if only the gross outliers are flagged.
+    """
+    mydata = np.column_stack([grossoutlierdata(outlier=1e8),
+                              grossoutlierdata(seed=1, outlier=0),
+                              grossoutlierdata(seed=2, outlier=1e6)])
+    mydata[[3, 7], 1] = 1
+    OutlierInds, IterVals = stats.BatchGeneralizedESD(mydata, MaxNumOutliers)
+    out1 = True
+    for col in range(mydata.shape[1]):
+        MaxRsInd, MaxRs = directesd(mydata[:, col], MaxNumOutliers)
+        if verbose:
+            print(IterVals['MaxRs'][:, col])
+            print(MaxRs)
+        out1 &= np.allclose(IterVals['MaxRs'][:, col], MaxRs, rtol=1e-6) & (
+                np.all(IterVals['MaxRsInd'][:, col] == MaxRsInd))
+    out2 = (sorted(OutlierInds[0]) == [3, 7]) & (OutlierInds[1] is None) & (
+            sorted(OutlierInds[2]) == [3, 7])
+    return out1, out2
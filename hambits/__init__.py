@@ -3,14 +3,33 @@ Various functions used for Haminoea project scripts
 
 Dependencies
 ------------
+cache :
+    numpy
+    pandas
+    json
+
+images :
+    numpy
+    skimage.external.tifffile
+
+regions :
+    numpy
+    pandas
+
 stats :
     numpy
+    pandas
     scipy.stats
     warnings
+    functools
+    concurrent.futures
 
 utils :
     json
 
+volumes :
+    numpy
+
 Created on Sun 18 01:20:29 2016
 
 @author: Michelangelo
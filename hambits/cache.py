@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+Cache of parsed data files (ImageJ results, csv files) as typed columns in
+.npz files, so reruns of analyses skip parsing text.
+
+Each source file has its own cache file (in folder cachefolder next to the
+source file, unless another folder is given), which is rebuilt when the source
+file's path, modification time or size, the reader's options, or
+cacheversion change.
+
+Functions
+---------
+labelfiles :
+    Image file names from ImageJ 'Label' column, as categorical.
+parselabels :
+    Parse ImageJ 'Label' column to integer 'Image' and 'Time' columns and
+    categorical 'ImageFile' column.
+readresults :
+    Read ImageJ results file, with 'Label' parsed (parselabels).
+loadresults, loadcsv :
+    Cached versions of readresults and pandas.read_csv.
+cachedtable :
+    Load data frame from cache, or read it with a reader function and cache
+    it.
+savetable, loadtable :
+    Save/load data frame to/from cache file.
+
+@author: Michelangelo
+"""
+import numpy as np
+import pandas
+import json
+import os
+import re
+
+# Change to make all cache files stale (e.g. if readers change)
+cacheversion = 2
+# Name of cache folder made next to source files
+cachefolder = '.hamcache'
+
+
+def cachekey(filename, kind, options):
+    """
+    String identifying source file version (absolute path, modification time
+    and size), reader (kind and options), and cacheversion.
+    """
+    stats = os.stat(filename)
+    return json.dumps([os.path.abspath(filename), stats.st_mtime_ns,
+                       stats.st_size, kind, options, cacheversion],
+                      sort_keys=True)
+
+
+def cachepath(filename, kind, cachedir=None):
+    """
+    Path of cache file for source file filename and reader kind.
+    """
+    if cachedir is None:
+        cachedir = os.path.join(os.path.dirname(os.path.abspath(filename)),
+                                cachefolder)
+    return os.path.join(cachedir, os.path.basename(filename) + '.' + kind +
+                        '.npz')
+
+
+def allstrings(values):
+    """
+    True if all values (iterable) are strings.
+    """
+    return all(isinstance(value, str) for value in values)
+
+
+def savetable(mydf, cachefile, key):
+    """
+    Save data frame as typed columns in .npz file (replacing any old file in
+    one step). Numeric and boolean columns are saved as they are, categorical
+    columns as codes and categories, and other (object) columns as strings
+    with a mask of missing values (so no pickling is needed to load them).
+
+    Raises TypeError (and saves nothing) if the data frame cannot be loaded
+    back unchanged: column names, object index values, categories or
+    non-missing values of object columns that are not strings (e.g. a column
+    read as [False, nan] would load as ['False', nan]).
+    """
+    index = mydf.index.values
+    if not allstrings(mydf.columns):
+        raise TypeError('Column names must be strings to cache data frame')
+    if index.dtype == object and not allstrings(index):
+        raise TypeError('Index values must be strings to cache data frame')
+    arrays = {'key': np.array(key),
+              'columns': np.array([str(col) for col in mydf.columns]),
+              'index': index}
+    kinds = []
+    for k, col in enumerate(mydf.columns):
+        values = mydf[col]
+        if values.dtype.name == 'category':
+            if not allstrings(values.cat.categories):
+                raise TypeError('Categories of column ' + col +
+                                ' must be strings to cache data frame')
+            kinds.append('c')
+            arrays['values' + str(k)] = values.cat.codes.values
+            arrays['categories' + str(k)] = np.array(
+                values.cat.categories, dtype=str)
+        elif values.dtype == object:
+            missing = values.isnull().values
+            if not allstrings(values.values[np.logical_not(missing)]):
+                raise TypeError('Values of column ' + col +
+                                ' must be strings or missing to cache data'
+                                ' frame')
+            kinds.append('o')
+            arrays['values' + str(k)] = np.array(
+                ['' if miss else value for miss, value in
+                 zip(missing, values.values)], dtype=str)
+            arrays['missing' + str(k)] = missing
+        else:
+            kinds.append('n')
+            arrays['values' + str(k)] = values.values
+    arrays['kinds'] = np.array(kinds)
+    os.makedirs(os.path.dirname(cachefile), exist_ok=True)
+    with open(cachefile + '.tmp', 'wb') as myfile:
+        np.savez(myfile, **arrays)
+    os.replace(cachefile + '.tmp', cachefile)
+
+
+def loadtable(cachefile, key):
+    """
+    Load data frame saved by savetable; returns None if there is no cache
+    file, it cannot be read, or its key differs from key (stale).
+    """
+    try:
+        with np.load(cachefile, allow_pickle=False) as data:
+            if str(data['key']) != key:
+                return None
+            columns = {}
+            for k, (col, kind) in enumerate(zip(data['columns'],
+                                                data['kinds'])):
+                values = data['values' + str(k)]
+                if kind == 'c':
+                    values = pandas.Categorical.from_codes(
+                        values, data['categories' + str(k)])
+                elif kind == 'o':
+                    values = values.astype(object)
+                    values[data['missing' + str(k)]] = np.nan
+                columns[str(col)] = values
+            return pandas.DataFrame(columns, columns=list(data['columns']),
+                                    index=data['index'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def cachedtable(filename, reader, kind, cachedir=None, **options):
+    """
+    Load data frame for filename from cache if it is up to date; otherwise
+    read it with reader(filename, **options) and save it in cache. Data
+    frames that cannot be cached unchanged (see savetable) are not cached,
+    and on the first read the data frame is returned as loaded back from
+    the cache, so reruns give the same data frame.
+
+    Parameters :
+    ------------
+    filename : string
+        path of source file
+    reader : function
+        function(filename, **options) returning data frame
+    kind : string
+        name of reader (part of cache file name)
+    cachedir : string or None
+        folder for cache files; None for folder cachefolder next to filename
+    options : keyword arguments for reader (must be JSON-serializable)
+
+    Returns :
+    ---------
+    pandas data frame
+    """
+    key = cachekey(filename, kind, options)
+    cachefile = cachepath(filename, kind, cachedir)
+    mydf = loadtable(cachefile, key)
+    if mydf is None:
+        mydf = reader(filename, **options)
+        try:
+            savetable(mydf, cachefile, key)
+        except (OSError, TypeError):
+            # Cannot write cache (e.g. read-only folder), or data frame would
+            # not load back unchanged: just don't cache.
+            return mydf
+        cached = loadtable(cachefile, key)
+        if cached is not None:
+            mydf = cached
+    return mydf
+
+
+# Image file names (QCam): image number_time stamp
+filenamepattern = re.compile(r'^(.*)_([^_]*)$')
+
+
+def labelfiles(labels):
+    """
+    Image file names (without extension; last part of ImageJ labels
+    stack:roi:file) of labels (pandas Series of strings), in one pass.
+
+    Returns :
+    ---------
+    pandas Categorical (missing labels are nan)
+    """
+    imagefiles = [label.rpartition(':')[2] if isinstance(label, str) else
+                  None for label in labels.values]
+    codes, categories = pandas.factorize(np.array(imagefiles, dtype=object))
+    return pandas.Categorical.from_codes(codes, categories)
+
+
+def parselabels(labels):
+    """
+    Parse ImageJ labels (stack:roi:image_time) in one pass: the image file
+    name (last part of label) of each row is stored as categorical, and image
+    numbers and time stamps are parsed (with a compiled regular expression)
+    from its categories, i.e. once per image rather than once per row.
+
+    Parameters :
+    ------------
+    labels : pandas Series of strings
+
+    Returns :
+    ---------
+    pandas data frame (same index as labels) with columns 'Image' and 'Time'
+    (int, or float with nan if any labels are missing) and 'ImageFile'
+    (categorical; image file name without extension)
+    """
+    imagefiles = labelfiles(labels)
+    codes, categories = imagefiles.codes, imagefiles.categories
+    parts = [filenamepattern.match(name) for name in categories]
+    if None in parts:
+        raise ValueError('Label(s) not in format stack:roi:image_time: ' +
+                         ', '.join(name for name, part in
+                                   zip(categories, parts) if part is None))
+    parsed = pandas.DataFrame({'ImageFile': imagefiles}, index=labels.index)
+    for col, group in [('Image', 1), ('Time', 2)]:
+        values = np.array([int(part.group(group)) for part in parts],
+                          dtype=np.int64)
+        if np.any(codes < 0):
+            # Missing labels: float column with nan
+            values = np.r_[values.astype(float), np.nan]
+        parsed[col] = values[codes]
+    return parsed[['Image', 'Time', 'ImageFile']]
+
+
+def readresults(filename):
+    """
+    Read tab-delimited ImageJ results file (see HamSequence.seqprocess for
+    columns). ImageJ index column ' ' is renamed to 'IJind', and 'Label'
+    (stack:roi:image_time) is parsed to give integer 'Image' and 'Time'
+    columns, and categorical 'ImageFile' (see parselabels).
+    """
+    mydf = pandas.read_csv(filename, delimiter='\t')
+    mydf.rename(columns={' ': 'IJind'}, inplace=True)
+    parsed = parselabels(mydf['Label'])
+    for col in parsed.columns:
+        mydf[col] = parsed[col]
+    return mydf
+
+
+def loadresults(filename, cachedir=None):
+    """
+    readresults, from cache if up to date.
+    """
+    return cachedtable(filename, readresults, 'ijresults', cachedir)
+
+
+def loadcsv(filename, usecols=None, cachedir=None, **options):
+    """
+    pandas.read_csv(filename, **options), from cache if up to date; whole
+    file is cached, and columns usecols (all if None) are returned.
+    """
+    mydf = cachedtable(filename, pandas.read_csv, 'csv', cachedir, **options)
+    if usecols is not None:
+        mydf = mydf[list(usecols)]
+    return mydf
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Functions for reading image frames (tifs) from image sequences.
+
+Functions
+---------
+readframe :
+    Read a tif frame as a memory-mapped (read-only) numpy array if possible,
+    otherwise read it into memory.
+downsample :
+    Strided (zero-copy) view of an image, taking every scale-th pixel.
+flattenchannels :
+    Average color channels of a 16-bit RGB image (integer arithmetic).
+flattenfile :
+    Flatten one 48-bit RGB tif and save it as a 16-bit tif (for worker
+    processes of flatten48bitimages in CVR/48bitRGBto16bitGray.py).
+
+Uncompressed, contiguous tifs (e.g. QCam images) are memory-mapped, so taking
+a strided view or averaging channels only reads the parts of the file needed;
+compressed or tiled tifs cannot be, and are read in full with imread.
+
+@author: Michelangelo
+"""
+import numpy as np
+import skimage.external.tifffile as tifmod
+
+
+def readframe(filename, memmap=True):
+    """
+    Read first image in tif file.
+
+    Parameters :
+    ------------
+    filename : string
+        path to tif file
+    memmap : bool
+        If True, return a read-only numpy.memmap of the image data if the file
+        allows it (uncompressed, contiguous); else read image with imread.
+
+    Returns :
+    ---------
+    numpy array (numpy.memmap if memory-mapped) of image data
+    """
+    if memmap:
+        try:
+            # Newer tifffile versions
+            return tifmod.memmap(filename, page=0, mode='r')
+        except AttributeError:
+            # Older tifffile versions (no memmap function)
+            try:
+                with tifmod.TiffFile(filename) as tif:
+                    return tif.asarray(key=0, memmap=True)
+            except (TypeError, ValueError):
+                pass
+        except ValueError:
+            # Image data not memory-mappable (e.g. compressed).
+            pass
+    return tifmod.imread(filename)
+
+
+def downsample(image, scale):
+    """
+    Return view of image with every scale-th pixel along first two axes (no
+    copy; copy result to keep it without keeping image in memory).
+
+    Parameters :
+    ------------
+    image : numpy array
+        image with at least 2 dimensions
+    scale : int
+        downsampling factor
+
+    Returns :
+    ---------
+    numpy array (view of image)
+    """
+    scale = int(scale)
+    return image[::scale, ::scale]
+
+
+def flattenchannels(image, out=None, rowsperblock=256):
+    """
+    Average color channels of 16-bit RGB image with integer arithmetic
+    (same result as np.mean(image, 2).astype(np.uint16)). Works through image
+    in blocks of rows, so a memory-mapped image is read block by block, and
+    only a small uint32 buffer is needed for the channel sums.
+
+    Parameters :
+    ------------
+    image : numpy array
+        uint16 array with shape (rows, columns, channels)
+    out : numpy array
+        uint16 array with shape (rows, columns) to put result in; if None, a
+        new array is made.
+    rowsperblock : int
+        number of rows averaged at a time
+
+    Returns :
+    ---------
+    out : uint16 numpy array with averaged channels
+    """
+    nrows, ncols, nchannels = image.shape
+    if out is None:
+        out = np.empty((nrows, ncols), dtype=np.uint16)
+    rowsperblock = min(rowsperblock, nrows)
+    sums = np.empty((rowsperblock, ncols), dtype=np.uint32)
+    for start in range(0, nrows, rowsperblock):
+        stop = min(start + rowsperblock, nrows)
+        blocksum = sums[:stop-start]
+        np.sum(image[start:stop], axis=2, dtype=np.uint32, out=blocksum)
+        blocksum //= nchannels
+        out[start:stop] = blocksum
+    return out
+
+
+# Output buffers kept between files (one per image shape) in each process.
+_outbuffers = {}
+
+
+def flattenfile(args):
+    """
+    Read one 48-bit RGB tif, average channels, and save as 16-bit tif. Used
+    by flatten48bitimages (CVR/48bitRGBto16bitGray.py), one call per file, in
+    worker processes (which import it from here).
+
+    Parameters :
+    ------------
+    args : tuple
+        (currentfile, newfilepath): path of image to read, and path to save
+        flattened image to.
+
+    Returns :
+    ---------
+    None if image was saved; otherwise string describing problem.
+    """
+    currentfile, newfilepath = args
+    currentimage = readframe(currentfile)
+    # check if image reads as numpy.ndarray and has correct type
+    # (16 bit) and shape (3 channels).
+    if not isinstance(currentimage, np.ndarray):
+        return currentfile + ' not read.'
+    if not ((currentimage.dtype == 'uint16') and (currentimage.ndim == 3)):
+        return currentfile + ' is not of the right type.'
+    shape = currentimage.shape[:2]
+    if shape not in _outbuffers:
+        _outbuffers[shape] = np.empty(shape, dtype=np.uint16)
+    # Flatten color channels to 16-bit
+    flatimage = flattenchannels(currentimage, out=_outbuffers[shape])
+    # For the life of me, I can't get this module to save metadata as it
+    # claims it will. Just saving in description.
+    tifmod.imsave(newfilepath, flatimage, description=currentfile)
+    return None
@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+"""
+Shape measurements of labeled regions (as ImageJ 'Measure' of traced
+selections), calculated for all regions at once (no loops over regions).
+
+Functions
+---------
+pixellists :
+    Label, row and column of each labeled pixel.
+moments :
+    Area, centroid and fitted ellipse (Major, Minor, Angle).
+convexhulls :
+    Convex hull of pixel corners of each region.
+feret :
+    Feret diameter, its angle and starting point, and MinFeret, by rotating
+    calipers on convex hulls.
+tracedperimeter :
+    Perimeter of traced outlines (for circularity).
+measureregions :
+    All of above (except perimeter) for a labeled image, as a data frame.
+measurepixels :
+    As measureregions, but for pixel lists (regions may overlap).
+
+Coordinates are in pixels, with x to the right and y down (as ImageJ); angles
+are in degrees counterclockwise from the x axis (as seen in the image), from
+0 to 180.
+
+@author: Michelangelo
+"""
+import numpy as np
+import pandas
+
+# Columns of measurements (in order of ImageJ results)
+measurecols = ['Area', 'X', 'Y', 'Major', 'Minor', 'Angle', 'Feret',
+               'FeretX', 'FeretY', 'FeretAngle', 'MinFeret']
+
+
+def pixellists(labels):
+    """
+    Label, row (y) and column (x) of each labeled (non-zero) pixel of labels
+    (2D numpy array of int).
+    """
+    ys, xs = np.nonzero(labels)
+    return labels[ys, xs], ys, xs
+
+
+def groupstarts(keys):
+    """
+    Index of first element of each group of equal values in sorted keys.
+    """
+    return np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+
+
+def moments(labs, ys, xs, nlabels):
+    """
+    Area, centroid (X, Y), and fitted ellipse (Major, Minor, Angle; as ImageJ
+    EllipseFitter) of regions, from pixel moments.
+
+    Parameters :
+    ------------
+    labs, ys, xs : numpy arrays of int
+        label (1 to nlabels), row and column of each pixel
+    nlabels : int
+        number of labels
+
+    Returns :
+    ---------
+    dict of numpy arrays (values for labels 1 to nlabels; nan for labels
+    without pixels): Area, X, Y, Major, Minor, Angle
+    """
+    xs = xs + 0.5
+    ys = ys + 0.5
+    area = np.bincount(labs, minlength=nlabels + 1)[1:].astype(float)
+
+    def labelmean(values):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.bincount(labs, weights=values,
+                               minlength=nlabels + 1)[1:]/area
+    xm = labelmean(xs)
+    ym = labelmean(ys)
+    dx = xs - xm[labs - 1]
+    dy = ys - ym[labs - 1]
+    # Central moments (with 1/12 for each pixel's own extent, as ImageJ)
+    u20 = labelmean(dx**2) + 1/12
+    u02 = labelmean(dy**2) + 1/12
+    # y axis up (so angles are counterclockwise)
+    u11 = -labelmean(dx*dy)
+    # Axes of ellipse with same second moments, scaled to same area
+    common = np.sqrt((u20 - u02)**2 + 4*u11**2)
+    major = np.sqrt(2*(u20 + u02 + common))
+    minor = np.sqrt(np.maximum(2*(u20 + u02 - common), 0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = np.sqrt(area/(np.pi*major*minor))
+    scale[np.isinf(scale)] = 1
+    angle = np.degrees(0.5*np.arctan2(2*u11, u20 - u02)) % 180
+    area[area == 0] = np.nan
+    return {'Area': area, 'X': xm, 'Y': ym, 'Major': 2*major*scale,
+            'Minor': 2*minor*scale, 'Angle': angle}
+
+
+def convexchains(labs, us, vs, side):
+    """
+    Convex chains (convex hull on one side) of points sorted by label, then
+    by strictly increasing v within each label, by removing all points that
+    are not convex in each pass (for all labels at once) until none are left.
+    The first and last point of each label are kept.
+
+    Parameters :
+    ------------
+    labs, us, vs : numpy arrays
+        label, and coordinates (u is function of v) of points
+    side : 1 or -1
+        1 to keep smallest u (convex minorant), -1 to keep largest u
+
+    Returns :
+    ---------
+    index (into labs, us, vs) of points of chains
+    """
+    keep = np.arange(len(labs))
+    while len(keep) > 2:
+        lab, u, v = labs[keep], us[keep], vs[keep]
+        # Interior points of chains (same label on both sides)
+        inner = np.flatnonzero((lab[1:-1] == lab[:-2]) &
+                               (lab[1:-1] == lab[2:])) + 1
+        cross = ((u[inner] - u[inner-1])*(v[inner+1] - v[inner]) -
+                 (v[inner] - v[inner-1])*(u[inner+1] - u[inner]))
+        remove = inner[side*cross >= 0]
+        if len(remove) == 0:
+            break
+        keep = np.delete(keep, remove)
+    return keep
+
+
+def convexhulls(labs, ys, xs):
+    """
+    Convex hulls of pixel corners of regions. Uses leftmost and rightmost
+    pixel of each row of each region, so only pixels on region outlines
+    matter.
+
+    Parameters :
+    ------------
+    labs, ys, xs : numpy arrays of int
+        label (1 to nlabels), row and column of each pixel
+
+    Returns :
+    ---------
+    hlabs, hxs, hys : numpy arrays of int
+        label and coordinates of hull vertices (pixel corners), sorted by
+        label, and counterclockwise (as seen in image) for each label,
+        starting at top left
+    """
+    labs, ys, xs = (np.asarray(labs, dtype=np.int64),
+                    np.asarray(ys, dtype=np.int64),
+                    np.asarray(xs, dtype=np.int64))
+    if len(labs) == 0:
+        return labs, xs, ys
+    nrows = ys.max() + 2
+    order = np.lexsort((xs, ys, labs))
+    rowkeys = (labs*nrows + ys)[order]
+    starts = groupstarts(rowkeys)
+    ends = np.r_[starts[1:], len(rowkeys)] - 1
+    rowlabs = labs[order][starts]
+    rowys = ys[order][starts]
+    lefts = xs[order][starts]
+    rights = xs[order][ends] + 1
+
+    chains = []
+    for xcorners, side in [(lefts, 1), (rights, -1)]:
+        # Corners at top and bottom of each row; at each corner y, keep
+        # smallest (left) or largest (right) x.
+        clabs = np.repeat(rowlabs, 2)
+        cys = np.column_stack([rowys, rowys + 1]).ravel()
+        cxs = np.repeat(xcorners, 2)
+        order = np.lexsort((side*cxs, cys, clabs))
+        first = order[groupstarts((clabs*(nrows + 1) + cys)[order])]
+        keep = first[convexchains(clabs[first], cxs[first], cys[first],
+                                  side)]
+        chains.append((clabs[keep], cxs[keep], cys[keep]))
+
+    # Left chain down, then right chain up
+    hlabs = np.r_[chains[0][0], chains[1][0]]
+    hxs = np.r_[chains[0][1], chains[1][1]]
+    hys = np.r_[chains[0][2], chains[1][2]]
+    sides = np.r_[np.zeros(len(chains[0][0])), np.ones(len(chains[1][0]))]
+    order = np.lexsort((np.where(sides == 0, hys, -hys), sides, hlabs))
+    return hlabs[order], hxs[order], hys[order]
+
+
+def feret(hlabs, hxs, hys, nlabels):
+    """
+    Feret diameter (largest caliper width), its start point (end with
+    smaller x) and angle, and MinFeret (smallest caliper width) of convex
+    hulls, by rotating calipers (as ImageJ).
+
+    Parameters :
+    ------------
+    hlabs, hxs, hys : numpy arrays
+        hull vertices, as returned by convexhulls
+    nlabels : int
+        number of labels
+
+    Returns :
+    ---------
+    dict of numpy arrays (values for labels 1 to nlabels; nan for labels
+    without hulls): Feret, FeretX, FeretY, FeretAngle, MinFeret
+    """
+    results = {key: np.full(nlabels, np.nan) for key in
+               ['Feret', 'FeretX', 'FeretY', 'FeretAngle', 'MinFeret']}
+    if len(hlabs) == 0:
+        return results
+    hxs = np.asarray(hxs, dtype=float)
+    # y axis up, so hulls are counterclockwise
+    hvs = -np.asarray(hys, dtype=float)
+    starts = groupstarts(hlabs)
+    sizes = np.diff(np.r_[starts, len(hlabs)])
+    first = np.repeat(starts, sizes)
+    sizerep = np.repeat(sizes, sizes)
+    # Next vertex (in same hull) of each vertex, i.e. edge from each vertex
+    nextinds = first + (np.arange(len(hlabs)) - first + 1) % sizerep
+    ex = hxs[nextinds] - hxs
+    ev = hvs[nextinds] - hvs
+    # Edge direction angle, increasing from 0 around each hull (turns are
+    # never negative, as hulls are convex)
+    prevex = np.roll(ex, 1)
+    prevev = np.roll(ev, 1)
+    turns = np.arctan2(np.maximum(prevex*ev - prevev*ex, 0),
+                       prevex*ex + prevev*ev)
+    turns[starts] = 0
+    angles = np.cumsum(turns)
+    angles -= np.repeat(angles[starts], sizes)
+    # Antipodal vertex of each edge: start of first edge with direction
+    # opposite to it (or beyond)
+    keys = hlabs*8*np.pi + angles
+    opposite = np.where(angles < np.pi, angles + np.pi, angles - np.pi)
+    antipodal = np.searchsorted(keys, hlabs*8*np.pi + opposite)
+    antipodal = first + (antipodal - first) % sizerep
+
+    # Candidate vertex pairs (edge ends with antipodal vertex and its
+    # neighbours, which covers ties from parallel edges)
+    neighbours = [first + (antipodal - first + k) % sizerep
+                  for k in (-1, 0, 1)]
+    # MinFeret: smallest over edges of distance from edge to farthest vertex
+    lengths = np.hypot(ex, ev)
+    widths = np.max([np.abs(ex*(hvs[j] - hvs) - ev*(hxs[j] - hxs))
+                     for j in neighbours], axis=0)/lengths
+    minferet = np.minimum.reduceat(widths, starts)
+    # Feret: largest distance between candidate pairs
+    ends1 = np.concatenate([np.arange(len(hlabs)), nextinds]*3)
+    ends2 = np.concatenate([j for j in neighbours for k in range(2)])
+    dists = np.hypot(hxs[ends2] - hxs[ends1], hvs[ends2] - hvs[ends1])
+    pairlabs = np.tile(hlabs, 6)
+    order = np.lexsort((-dists, pairlabs))
+    best = order[groupstarts(pairlabs[order])]
+    p1, p2 = ends1[best], ends2[best]
+    swap = hxs[p1] > hxs[p2]
+    p1, p2 = np.where(swap, p2, p1), np.where(swap, p1, p2)
+
+    inds = hlabs[starts] - 1
+    results['Feret'][inds] = dists[best]
+    results['FeretX'][inds] = hxs[p1]
+    results['FeretY'][inds] = -hvs[p1]
+    results['FeretAngle'][inds] = np.degrees(np.arctan2(
+        hvs[p2] - hvs[p1], hxs[p2] - hxs[p1])) % 180
+    results['MinFeret'][inds] = minferet
+    return results
+
+
+def tracedperimeter(labels, nlabels):
+    """
+    Perimeter of each labeled region (as ImageJ traced selections): number
+    of pixel edges on the boundary, minus (2-sqrt(2)) for each corner, with
+    only about every other corner counted along 1-pixel sides.
+
+    Parameters :
+    ------------
+    labels : 2D numpy array of int
+        labeled image (0 is background); regions must not touch (e.g.
+        8-connected components)
+    nlabels : int
+        number of labels
+
+    Returns :
+    ---------
+    numpy array of perimeters of labels 1 to nlabels
+    """
+    padded = np.pad(labels, 1, mode='constant')
+    # Boundary edges: neighbouring pixels with different labels
+    edges = np.zeros(nlabels + 1)
+    for a, b in [(padded[1:, :], padded[:-1, :]),
+                 (padded[:, 1:], padded[:, :-1])]:
+        differ = a != b
+        edges += np.bincount(a[differ], minlength=nlabels + 1)
+        edges += np.bincount(b[differ], minlength=nlabels + 1)
+    # Pixel corner points, from 2x2 windows of pixels (top left, top right,
+    # bottom left, bottom right); each window has at most one label.
+    tl, tr = padded[:-1, :-1], padded[:-1, 1:]
+    bl, br = padded[1:, :-1], padded[1:, 1:]
+    pointlabels = np.maximum(np.maximum(tl, tr), np.maximum(bl, br))
+    tl, tr, bl, br = tl > 0, tr > 0, bl > 0, br > 0
+    count = (tl.astype(int) + tr + bl + br)
+    vertex = (count == 1) | (count == 3)
+    diagonal = (tl & br & ~tr & ~bl) | (tr & bl & ~tl & ~br)
+    # Sides of 1 pixel (between neighbouring vertices): ImageJ skips the
+    # corner at the end of each, unless the corner at its start was skipped,
+    # i.e. about (m+1)/2 corners skipped along m consecutive 1-pixel sides.
+    unith = vertex[:, :-1] & vertex[:, 1:] & (tr != br)[:, :-1]
+    unitv = vertex[:-1, :] & vertex[1:, :] & (bl != br)[:-1, :]
+    sides = np.zeros(vertex.shape)
+    sides[:, :-1] += unith
+    sides[:, 1:] += unith
+    sides[:-1, :] += unitv
+    sides[1:, :] += unitv
+    # Vertices between two 1-pixel sides join them into one run, so
+    # skipped = (number of sides + number of runs)/2.
+    corners = vertex + 2.0*diagonal - 0.5*sides + 0.5*(vertex & (sides == 2))
+    corners = np.bincount(pointlabels.ravel(), weights=corners.ravel(),
+                          minlength=nlabels + 1)
+    return (edges - corners*(2 - np.sqrt(2)))[1:]
+
+
+def measurepixels(labs, ys, xs, nlabels=None):
+    """
+    Measure regions given as pixel lists (so regions may overlap).
+
+    Parameters :
+    ------------
+    labs, ys, xs : numpy arrays of int
+        label (1 to nlabels), row and column of each pixel
+    nlabels : int or None
+        number of labels (None: largest label)
+
+    Returns :
+    ---------
+    pandas data frame indexed by label (1 to nlabels), with columns
+    measurecols (nan for labels without pixels)
+    """
+    labs = np.asarray(labs, dtype=np.int64)
+    if nlabels is None:
+        nlabels = int(labs.max()) if len(labs) else 0
+    results = moments(labs, ys, xs, nlabels)
+    results.update(feret(*convexhulls(labs, ys, xs), nlabels=nlabels))
+    return pandas.DataFrame(results, columns=measurecols,
+                            index=pandas.Index(np.arange(1, nlabels + 1),
+                                               name='Region'))
+
+
+def measureregions(labels, nlabels=None):
+    """
+    Measure regions of labeled image (2D numpy array of int, 0 is
+    background); see measurepixels.
+    """
+    if nlabels is None:
+        nlabels = int(np.max(labels)) if np.size(labels) else 0
+    return measurepixels(*pixellists(labels), nlabels=nlabels)
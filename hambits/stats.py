@@ -7,8 +7,88 @@ Created on Sun Dec 18 11:25:56 2016
 @author: Michelangelo
 """
 import numpy as np
+import pandas
 import scipy.stats as st
 import warnings as wrn
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+
+
+# Maximum number of entries kept in each cache of critical values
+cachesize = 4096
+
+
+@lru_cache(maxsize=cachesize)
+def esdcriticalvalues(n, MaxNumOutliers, Alpha):
+    """
+    Critical values (lambda_i) for generalized ESD test for i = 1 to
+    MaxNumOutliers, with n values and alpha level Alpha (cached).
+
+    Returns :
+    -----------
+    read-only numpy array of length MaxNumOutliers (nan where n is too small)
+    """
+    n = int(n)
+    j = np.arange(1, MaxNumOutliers + 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Adjust 1-Alpha for 2 tails & n-j+1 possible comparisons
+        Padj = 1 - Alpha/(2*(n-j+1))
+        # t-value w/ cummulative probability Padj & n-1-j degrees of freedom
+        Tcrit = st.t.ppf(Padj, n-j-1)
+        # Calculate crtical values for standardized residual
+        Rcrit = (n - j) * Tcrit / (((n - j - 1 + Tcrit**2)*(n-j+1))**0.5)
+    Rcrit.setflags(write=False)
+    return Rcrit
+
+
+@lru_cache(maxsize=cachesize)
+def tquantiles(df, interval):
+    """
+    Lower and upper quantiles of t-distribution with df degrees of freedom
+    bounding central interval (cached; same as st.t.interval(interval, df)).
+    """
+    return tuple(st.t.interval(interval, int(df)))
+
+
+@lru_cache(maxsize=cachesize)
+def binomindices(n, interval, quantile):
+    """
+    Lower and upper bounds of central interval of binomial distribution with
+    n trials and probability quantile (cached; same as
+    st.binom.interval(interval, n, quantile)). Used as indices of order
+    statistics for confidence intervals of quantiles (cib).
+    """
+    return tuple(st.binom.interval(interval, int(n), quantile))
+
+
+def precomputecriticalvalues(NValues=range(3, 201), Alphas=(0.05, 0.01),
+                             MaxNumOutliers=10, Intervals=(0.9, 0.95, 0.99),
+                             Quantiles=(0.5,)):
+    """
+    Fill caches of critical values for common numbers of values and alpha
+    levels / intervals (e.g. before bootstrap or parameter sweep runs).
+    Number of combinations should be less than cachesize.
+
+    Parameters :
+    ------------
+    NValues : iterable of int
+        numbers of values (n)
+    Alphas : iterable of float
+        alpha levels for generalized ESD test
+    MaxNumOutliers : int
+        number of ESD critical values for each n and alpha
+    Intervals : iterable of float
+        widths of confidence intervals (cit, cib)
+    Quantiles : iterable of float
+        quantiles for cib
+    """
+    for n in NValues:
+        for Alpha in Alphas:
+            esdcriticalvalues(n, MaxNumOutliers, Alpha)
+        for interval in Intervals:
+            tquantiles(n-1, interval)
+            for quantile in Quantiles:
+                binomindices(n-1, interval, quantile)
 
 
 def GeneralizedESD(MyData, MaxNumOutliers, Alpha=0.05):
@@ -104,29 +184,68 @@ def GeneralizedESD(MyData, MaxNumOutliers, Alpha=0.05):
               'MaxRs': np.full(MaxNumOutliers, np.nan),
               'Vals': np.full(MaxNumOutliers, np.nan),
               'Rcrit': np.full(MaxNumOutliers, np.nan)}
-    for k in range(0, MaxNumOutliers):
-        # Calculate standardized residuals (Rs), and get maximum and its index
-        Rs = abs(MyData-np.nanmean(MyData))/np.nanstd(MyData)
-        MaxRsInd = np.nanargmax(Rs)
-        MaxRs = Rs[MaxRsInd]
 
-        # Calculate critical value
-        j = k + 1
-        # Adjust 1-Alpha for 2 tails & n-j+1 possible comparisons
-        Padj = 1 - Alpha/(2*(n-j+1))
-        # t-value w/ cummulative probability Padj & n-1-j degrees of freedom
-        Tcrit = st.t.ppf(Padj, n-j-1)
-        # Calculate crtical values for standardized residual
-        Rcrit = (n - j) * Tcrit / (((n - j - 1 + Tcrit**2)*(n-j+1))**0.5)
+    # Sort (non-nan) data once; the point with the maximum standardized
+    # residual is always the lowest or highest remaining value, so remove
+    # points from either end of the sorted data, keeping running sums (of
+    # values and squared values, shifted by the mean) to get mean and
+    # standard deviation of the remaining data. Removing a gross outlier
+    # leaves sums dominated by rounding error (the shift is far from the
+    # mean of the remaining data), so when the sum of squared deviations of
+    # the remaining data drops below half of its value when the sums were
+    # last computed, the sums are recomputed about the mean of the remaining
+    # data.
+    Inds = np.flatnonzero(np.logical_not(np.isnan(MyData)))
+    Order = Inds[np.argsort(MyData[Inds], kind='mergesort')]
+    SortedData = MyData[Order]
+    Shift = np.mean(SortedData)
+    Sum = np.sum(SortedData - Shift)
+    SumSq = np.sum((SortedData - Shift)**2)
+    SumSqRef = SumSq
+    m = len(SortedData)
+    Lo, Hi = 0, m - 1
+    # Runs of equal values: indices in a run are removed in increasing order
+    # (so ties go to the first index, as with np.nanargmax).
+    RunStart = np.r_[0, np.flatnonzero(np.diff(SortedData)) + 1]
+    RunOf = np.searchsorted(RunStart, np.arange(m), side='right') - 1
+    RunNext = RunStart.copy()
+
+    # Critical values for all iterations
+    IterVals['Rcrit'][:] = esdcriticalvalues(n, MaxNumOutliers, Alpha)
+
+    for k in range(0, MaxNumOutliers):
+        if Lo > Hi:
+            raise ValueError('MaxNumOutliers > number of (non-nan) values')
+        # Mean and standard deviation of remaining data, and standardized
+        # residuals (Rs) of lowest and highest values.
+        Mean = Sum/(Hi - Lo + 1)
+        Std = max(SumSq/(Hi - Lo + 1) - Mean**2, 0)**0.5
+        LoRs = abs(SortedData[Lo] - Shift - Mean)/Std
+        HiRs = abs(SortedData[Hi] - Shift - Mean)/Std
+        LoInd = Order[RunNext[RunOf[Lo]]]
+        HiInd = Order[RunNext[RunOf[Hi]]]
+        if (LoRs > HiRs) or (LoRs == HiRs and LoInd <= HiInd):
+            MaxRs, MaxRsInd, Pos = LoRs, LoInd, Lo
+            Lo += 1
+        else:
+            MaxRs, MaxRsInd, Pos = HiRs, HiInd, Hi
+            Hi -= 1
+        RunNext[RunOf[Pos]] += 1
 
         # Store values in IterVals
         IterVals['MaxRsInd'][k] = MaxRsInd
         IterVals['MaxRs'][k] = MaxRs
         IterVals['Vals'][k] = MyData[MaxRsInd]
-        IterVals['Rcrit'][k] = Rcrit
 
-        # remove value at index for next round
-        MyData[MaxRsInd] = np.nan
+        # remove value for next round
+        Sum -= SortedData[Pos] - Shift
+        SumSq -= (SortedData[Pos] - Shift)**2
+        Count = Hi - Lo + 1
+        if Count > 0 and SumSq - Sum**2/Count < SumSqRef/2:
+            Shift = np.mean(SortedData[Lo:Hi+1])
+            Sum = np.sum(SortedData[Lo:Hi+1] - Shift)
+            SumSq = np.sum((SortedData[Lo:Hi+1] - Shift)**2)
+            SumSqRef = SumSq
 
     # Identify indices for significant values
     OutlierInds = None
@@ -140,6 +259,204 @@ def GeneralizedESD(MyData, MaxNumOutliers, Alpha=0.05):
     return OutlierInds, IterVals
 
 
+def BatchGeneralizedESD(MyData, MaxNumOutliers, Alpha=0.05, Axis=0,
+                        NumValues=None):
+    """
+    Generalized ESD test for outliers (see GeneralizedESD), run independently
+    on every column (Axis=0) or row (Axis=1) of a 2D array, with all columns
+    handled together in each iteration. Nans are ignored (as in
+    GeneralizedESD). Critical values are calculated once for each number of
+    values.
+
+    Parameters :
+    ------------
+    MyData : 2D array-like
+    MaxNumOutliers : int
+        upper-bound on number of suspected outliers in each column
+    Alpha : float
+        Alpha level for test, 0 < Alpha < 1 (see GeneralizedESD)
+    Axis : int
+        0 to test each column, 1 to test each row
+    NumValues : array-like of int, optional
+        number of values (n) in each column used for critical values; default
+        is length of columns (including nans, as in GeneralizedESD)
+
+    Returns :
+    -----------
+    OutlierInds : list
+        for each column, array of indices of outliers in column (None if no
+        outliers)
+    IterVals : dict
+        MaxRsInd, MaxRs, Vals, Rcrit, sig : arrays with shape
+            (MaxNumOutliers, number of columns); as in GeneralizedESD (nan
+            where column had too few values to remove another).
+        NumOutliers : array of number of outliers in each column
+    """
+    MyData = np.array(MyData).astype(float)
+    if MyData.ndim != 2:
+        raise ValueError('MyData must be 2 dimensional')
+    if Axis == 1:
+        MyData = MyData.T
+    n, ncols = MyData.shape
+    if NumValues is None:
+        NumValues = np.full(ncols, n)
+    NumValues = np.asarray(NumValues)
+    Cols = np.arange(ncols)
+
+    # Critical values, calculated once for each value of n
+    UniqueN, NInv = np.unique(NumValues, return_inverse=True)
+    Rcrit = np.column_stack([esdcriticalvalues(N, MaxNumOutliers, Alpha)
+                             for N in UniqueN])
+    IterVals = {'MaxRsInd': np.full((MaxNumOutliers, ncols), np.nan),
+                'MaxRs': np.full((MaxNumOutliers, ncols), np.nan),
+                'Vals': np.full((MaxNumOutliers, ncols), np.nan),
+                'Rcrit': Rcrit[:, NInv]}
+
+    # Sort each column once (nans last), and remove points from either end
+    # of sorted columns, keeping running sums, recomputed for a column when
+    # its remaining sum of squared deviations drops below half of its value
+    # when its sums were last computed (see GeneralizedESD). Work on
+    # flattened array of sorted columns (column by column).
+    Order = np.argsort(MyData, axis=0, kind='mergesort').T
+    SortedData = MyData[Order, Cols[:, None]]
+    m = np.sum(np.logical_not(np.isnan(SortedData)), axis=1)
+    Valid = np.arange(n)[None, :] < m[:, None]
+    Shift = np.nanmean(np.where(Valid, SortedData, np.nan), axis=1)
+    Shift[m == 0] = 0
+    Centered = np.where(Valid, SortedData - Shift[:, None], 0)
+    Sum = Centered.sum(axis=1)
+    SumSq = (Centered**2).sum(axis=1)
+    SumSqRef = SumSq.copy()
+    Lo = Cols*n
+    Hi = Cols*n + m - 1
+    FlatData = SortedData.ravel()
+    FlatOrder = Order.ravel()
+    # Runs of equal values within each column: indices in a run are removed
+    # in increasing order (ties go to the first index).
+    Breaks = np.diff(FlatData) != 0
+    Breaks[n-1::n] = True
+    RunStart = np.r_[0, np.flatnonzero(Breaks) + 1]
+    RunOf = np.searchsorted(RunStart, np.arange(n*ncols), side='right') - 1
+    RunNext = RunStart.copy()
+
+    for k in range(0, MaxNumOutliers):
+        Active = Lo <= Hi
+        if not np.any(Active):
+            break
+        A = Cols[Active]
+        ALo, AHi = Lo[Active], Hi[Active]
+        Count = AHi - ALo + 1
+        Mean = Sum[Active]/Count
+        with np.errstate(divide='ignore', invalid='ignore'):
+            Std = np.maximum(SumSq[Active]/Count - Mean**2, 0)**0.5
+            LoRs = abs(FlatData[ALo] - Shift[A] - Mean)/Std
+            HiRs = abs(FlatData[AHi] - Shift[A] - Mean)/Std
+        LoInd = FlatOrder[RunNext[RunOf[ALo]]]
+        HiInd = FlatOrder[RunNext[RunOf[AHi]]]
+        UseLo = (LoRs > HiRs) | ((LoRs == HiRs) & (LoInd <= HiInd))
+        Pos = np.where(UseLo, ALo, AHi)
+        MaxRsInd = np.where(UseLo, LoInd, HiInd)
+
+        # Store values in IterVals
+        IterVals['MaxRsInd'][k, A] = MaxRsInd
+        IterVals['MaxRs'][k, A] = np.where(UseLo, LoRs, HiRs)
+        IterVals['Vals'][k, A] = FlatData[Pos]
+
+        # remove values for next round
+        RunNext[RunOf[Pos]] += 1
+        Lo[A] += UseLo
+        Hi[A] -= np.logical_not(UseLo)
+        Sum[A] -= FlatData[Pos] - Shift[A]
+        SumSq[A] -= (FlatData[Pos] - Shift[A])**2
+        Count = Hi[A] - Lo[A] + 1
+        Redo = (Count > 0) & (SumSq[A] - Sum[A]**2/np.maximum(Count, 1) <
+                              SumSqRef[A]/2)
+        for c in A[Redo]:
+            Remaining = FlatData[Lo[c]:Hi[c]+1]
+            Shift[c] = np.mean(Remaining)
+            Sum[c] = np.sum(Remaining - Shift[c])
+            SumSq[c] = np.sum((Remaining - Shift[c])**2)
+            SumSqRef[c] = SumSq[c]
+
+    # Identify number of outliers: largest number of removed points for
+    # which the maximum residual is greater than the critical value.
+    with np.errstate(invalid='ignore'):
+        Exceeds = IterVals['MaxRs'] > IterVals['Rcrit']
+    LastExceeds = MaxNumOutliers - 1 - np.argmax(Exceeds[::-1], axis=0)
+    NumOutliers = np.where(np.any(Exceeds, axis=0), LastExceeds + 1, 0)
+    IterVals['sig'] = np.arange(MaxNumOutliers)[:, None] < NumOutliers
+    IterVals['NumOutliers'] = NumOutliers
+    OutlierInds = [IterVals['MaxRsInd'][0:NumOutliers[c], c]
+                   if NumOutliers[c] > 0 else None for c in Cols]
+    return OutlierInds, IterVals
+
+
+def GroupedGeneralizedESD(MyDF, ValueColumn, GroupColumns, MaxNumOutliers,
+                          Alpha=0.05):
+    """
+    Generalized ESD test for outliers (see GeneralizedESD) on values in each
+    group of a long-format data frame, all groups tested together (see
+    BatchGeneralizedESD).
+
+    Parameters :
+    ------------
+    MyDF : pandas data frame
+    ValueColumn : string
+        name of column with values to test
+    GroupColumns : string or list
+        name(s) of column(s) defining groups
+    MaxNumOutliers : int
+        upper-bound on number of suspected outliers in each group
+    Alpha : float
+        Alpha level for test, 0 < Alpha < 1
+
+    Returns :
+    -----------
+    IsOutlier : pandas Series
+        boolean, with index of MyDF; True for outliers
+    IterTable : pandas data frame
+        one row per group and iteration, with group columns, 'Iteration'
+        (1 to MaxNumOutliers), 'Index' (index in MyDF of point with maximum
+        residual), 'MaxRs', 'Vals', 'Rcrit', and 'sig'
+    """
+    if isinstance(GroupColumns, str):
+        GroupColumns = [GroupColumns]
+    Groups = MyDF.groupby(GroupColumns, sort=True)
+    GroupNum = Groups.ngroup().values
+    Sizes = np.bincount(GroupNum)
+    # Position of each row within its group
+    RowOrder = np.argsort(GroupNum, kind='mergesort')
+    Starts = np.r_[0, np.cumsum(Sizes)[:-1]]
+    PosInGroup = np.empty(len(GroupNum), dtype=int)
+    PosInGroup[RowOrder] = np.arange(len(GroupNum)) - np.repeat(Starts, Sizes)
+    # Values in 2D array (one column per group, padded with nans)
+    Padded = np.full((max(Sizes), len(Sizes)), np.nan)
+    Padded[PosInGroup, GroupNum] = MyDF[ValueColumn].values
+    RowIndex = np.empty(Padded.shape, dtype=int)
+    RowIndex[PosInGroup, GroupNum] = np.arange(len(GroupNum))
+
+    OutlierInds, IterVals = BatchGeneralizedESD(Padded, MaxNumOutliers,
+                                                Alpha=Alpha, NumValues=Sizes)
+
+    # Iteration table (rows ordered by group, then iteration)
+    Keys = Groups.size().index.to_frame(index=False)
+    Found = np.logical_not(np.isnan(IterVals['MaxRsInd']))
+    RowPos = np.where(Found, IterVals['MaxRsInd'], 0).astype(int)
+    DFRow = RowIndex[RowPos, np.arange(len(Sizes))[None, :]]
+    IterTable = Keys.loc[np.repeat(np.arange(len(Sizes)), MaxNumOutliers)
+                         ].reset_index(drop=True)
+    IterTable['Iteration'] = np.tile(np.arange(1, MaxNumOutliers + 1),
+                                     len(Sizes))
+    IterTable['Index'] = np.where(Found, MyDF.index.values[DFRow],
+                                  None).T.ravel()
+    for key in ['MaxRs', 'Vals', 'Rcrit', 'sig']:
+        IterTable[key] = IterVals[key].T.ravel()
+
+    IsOutlier = np.zeros(len(MyDF), dtype=bool)
+    IsOutlier[DFRow[IterVals['sig'] & Found]] = True
+    return pandas.Series(IsOutlier, index=MyDF.index), IterTable
+
+
 def cit(myarray, interval=0.95):
     """
     confidence interval for mean of myarray, assuming t-distribution
@@ -187,8 +504,11 @@ def cit(myarray, interval=0.95):
         # Calculate average
         avg = np.mean(myarray2)
         # Calculate confidence interval
-        lb, ub = st.t.interval(interval, len(myarray2)-1,
-                               loc=avg, scale=st.sem(myarray2))
+        lbq, ubq = tquantiles(len(myarray2)-1, interval)
+        # Standard error of mean (as st.sem)
+        sem = np.std(myarray2, ddof=1)/np.sqrt(len(myarray2))
+        lb = lbq*sem + avg
+        ub = ubq*sem + avg
         return {'mean': avg, 'LB': lb, 'UB': ub}
     else:
         raise SystemExit('myarray should be 1 dimensional')
@@ -234,9 +554,331 @@ def cib(myarray, interval=0.95, quantile=0.5):
         # remove nans and sort
         myarray2 = np.sort(myarray[np.logical_not(np.isnan(myarray))])
         # Calculate confidence interval
-        lbind, ubind = st.binom.interval(interval, len(myarray2)-1, quantile)
+        lbind, ubind = binomindices(len(myarray2)-1, interval, quantile)
         lb = myarray2[int(lbind)]
         ub = myarray2[int(ubind)]
         return {'median': np.median(myarray2), 'LB': lb, 'UB': ub}
     else:
         raise SystemExit('myarray should be 1 dimensional')
+
+
+def bootstatistic(resamples, statistic='mean', quantile=0.5):
+    """
+    Calculate statistic ('mean', 'median' or 'quantile') of each row of 2D
+    array resamples.
+    """
+    if statistic == 'mean':
+        return np.mean(resamples, axis=1)
+    elif statistic == 'median':
+        return np.median(resamples, axis=1)
+    elif statistic == 'quantile':
+        return np.percentile(resamples, 100*quantile, axis=1)
+    else:
+        raise ValueError("statistic must be 'mean', 'median' or 'quantile'")
+
+
+def jackknifequantiles(data, quantile):
+    """
+    Quantile (as np.percentile, linear interpolation; quantile=0.5 gives the
+    median) of data with each value left out in turn, from data sorted once:
+    each leave-one-out quantile interpolates between two neighbouring order
+    statistics of data, so no (n x n-1) arrays are needed.
+
+    Returns :
+    ---------
+    1D numpy array of n leave-one-out quantiles (in order of sorted data)
+    """
+    sortdata = np.sort(data)
+    n = len(sortdata)
+    if n < 2:
+        return np.full(n, np.nan)
+    # Position of quantile among n-1 values left
+    pos = quantile*(n - 2)
+    lo = int(np.floor(pos))
+    frac = pos - lo
+    # Order statistics lo and lo+1 of the n-1 values left, for each left-out
+    # rank: shifted up by one at and above the left-out rank.
+    leaveout = np.arange(n)
+    below = sortdata[np.minimum(lo + (lo >= leaveout), n - 1)]
+    above = sortdata[np.minimum(lo + 1 + (lo + 1 >= leaveout), n - 1)]
+    return below + frac*(above - below)
+
+
+def bootstrapchunk(args):
+    """
+    Statistic of nboot bootstrap resamples of data, drawn with
+    np.random.RandomState(seed); used by cibootstrap (one call per chunk of
+    resamples, possibly in worker processes).
+
+    Parameters :
+    ------------
+    args : tuple
+        (data, statistic, quantile, nboot, seed)
+
+    Returns :
+    ---------
+    1D numpy array of nboot values of statistic
+    """
+    data, statistic, quantile, nboot, seed = args
+    rng = np.random.RandomState(seed)
+    # All resample indices for chunk as one 2D array (nboot x len(data))
+    inds = rng.randint(0, len(data), size=(nboot, len(data)))
+    return bootstatistic(data[inds], statistic, quantile)
+
+
+def cibootstrap(myarray, interval=0.95, statistic='mean', method='BCa',
+                nboot=10000, quantile=0.5, seed=None, chunksize=1000,
+                nprocs=1):
+    """
+    Bootstrap confidence interval for mean, median, or quantile of myarray,
+    by percentile or BCa (bias-corrected and accelerated) method, following
+    Efron and Tibshirani, An Introduction to the Bootstrap 1993, chapter 14.
+
+    Parameters :
+    ------------
+    myarray : 1D numpy.array, numeric
+    interval : float, 0<interval<1
+        width of confidence interval
+    statistic : string
+        'mean', 'median', or 'quantile'
+    method : string
+        'percentile' or 'BCa'
+    nboot : int
+        number of bootstrap resamples
+    quantile : float, 0<quantile<1
+        quantile to use if statistic is 'quantile'
+    seed : int or None
+        seed for random number generator (results for a given seed and
+        chunksize do not depend on nprocs)
+    chunksize : int
+        maximum number of resamples generated at once (to limit memory)
+    nprocs : int
+        number of processes to spread chunks over (1: all in this process)
+
+    Returns :
+    ---------
+    dict :
+        keys : values
+            UB : upper bound of confidence interval
+            LB : lower bound of confidence interval
+            mean, median or quantile (name of statistic) : statistic of
+                myarray
+
+    Example
+    ----------
+    zar = np.array([25.8, 24.6, 26.1, 22.9, 25.1, 27.3, 24.0, 24.5, 23.9,
+    26.2, 24.3, 24.6, 23.3, 25.5, 28.1, 24.8, 23.5, 26.3, 25.4, 25.5, 23.9,
+    27.0, 24.8, 22.9, 25.4])
+    print(cibootstrap(zar, 0.95, seed=0))
+    Gives bounds close to those from cit (t-distribution): LB ~24.5,
+    UB ~25.6.
+    """
+    # Check that equivalent to one dim array
+    if myarray.ndim != 1:
+        raise SystemExit('myarray should be 1 dimensional')
+    if method not in ('percentile', 'BCa'):
+        raise ValueError("method must be 'percentile' or 'BCa'")
+    # remove nans
+    data = myarray[np.logical_not(np.isnan(myarray))].astype(float)
+    n = len(data)
+    estimate = bootstatistic(data[None, :], statistic, quantile)[0]
+
+    # Bootstrap distribution of statistic, in chunks of resamples; each chunk
+    # has its own seed (drawn from seed), so results do not depend on how
+    # chunks are spread over processes.
+    chunks = [min(chunksize, nboot - start)
+              for start in range(0, nboot, chunksize)]
+    seeds = np.random.RandomState(seed).randint(0, 2**31 - 1,
+                                                size=len(chunks))
+    jobs = [(data, statistic, quantile, nchunk, chunkseed)
+            for nchunk, chunkseed in zip(chunks, seeds)]
+    if nprocs == 1:
+        bootvals = np.concatenate(list(map(bootstrapchunk, jobs)))
+    else:
+        with ProcessPoolExecutor(max_workers=nprocs) as executor:
+            bootvals = np.concatenate(list(executor.map(bootstrapchunk,
+                                                        jobs)))
+
+    alphas = np.array([(1 - interval)/2, (1 + interval)/2])
+    if method == 'BCa':
+        # Bias correction
+        z0 = st.norm.ppf(np.mean(bootvals < estimate))
+        # Acceleration from jackknife (leave-one-out) values of statistic
+        if statistic == 'mean':
+            jackvals = (np.sum(data) - data)/(n - 1)
+        else:
+            jackvals = jackknifequantiles(
+                data, 0.5 if statistic == 'median' else quantile)
+        jackdiff = np.mean(jackvals) - jackvals
+        with np.errstate(divide='ignore', invalid='ignore'):
+            accel = np.sum(jackdiff**3)/(6*np.sum(jackdiff**2)**1.5)
+        if not np.isfinite(accel):
+            accel = 0.
+        zalpha = st.norm.ppf(alphas)
+        alphas = st.norm.cdf(z0 + (z0 + zalpha)/(1 - accel*(z0 + zalpha)))
+    if np.any(np.isnan(alphas)):
+        lb, ub = np.nan, np.nan
+    else:
+        lb, ub = np.percentile(bootvals, 100*alphas)
+    return {statistic: estimate, 'LB': lb, 'UB': ub}
+
+
+def groupedvalues(mydata, groupby=None, columns=None):
+    """
+    Arrange data for cittable and cibtable: values of each column in one
+    flattened array, with an integer code for each (column, group).
+
+    Parameters :
+    ------------
+    mydata : 2D numpy.array or pandas data frame
+    groupby : None, column name(s) in mydata, or array-like
+        group labels (one per row); None: all rows in one group
+    columns : list or None
+        columns of mydata to use; default: all numeric columns (except
+        groupby columns)
+
+    Returns :
+    ---------
+    values : 1D numpy array (columns of mydata, one after the other)
+    codes : 1D numpy array of int, code of (column, group) for each value
+        (column number * number of groups + group number)
+    keys : pandas data frame with one row per code: group columns (if any)
+        and 'Column'
+    """
+    if not isinstance(mydata, pandas.DataFrame):
+        mydata = np.asarray(mydata, dtype=float)
+        if mydata.ndim == 1:
+            mydata = mydata[:, None]
+        elif mydata.ndim != 2:
+            raise SystemExit('mydata should be 1 or 2 dimensional')
+        mydata = pandas.DataFrame(mydata)
+    if groupby is None:
+        groupcols = []
+        grouplabels = np.zeros(len(mydata), dtype=int)
+    elif isinstance(groupby, (str, list, tuple)):
+        groupcols = [groupby] if isinstance(groupby, str) else list(groupby)
+        grouplabels = mydata[groupcols]
+    else:
+        groupcols = ['Group']
+        grouplabels = pandas.DataFrame({'Group': np.asarray(groupby)},
+                                       index=mydata.index)
+    if columns is None:
+        columns = [col for col in mydata.select_dtypes(include=[np.number])
+                   if col not in groupcols]
+
+    if groupcols:
+        groups = grouplabels.groupby(groupcols, sort=True)
+        groupcodes = groups.ngroup().values
+        groupkeys = groups.size().index.to_frame(index=False)
+    else:
+        groupcodes = grouplabels
+        groupkeys = pandas.DataFrame(index=[0])
+    ngroups = len(groupkeys)
+
+    values = mydata[columns].values.astype(float).T.ravel()
+    codes = (np.arange(len(columns))[:, None]*ngroups +
+             groupcodes[None, :]).ravel()
+    keys = groupkeys.loc[np.tile(np.arange(ngroups), len(columns))
+                         ].reset_index(drop=True)
+    keys['Column'] = np.repeat(columns, ngroups)
+    return values, codes, keys
+
+
+def cittable(mydata, interval=0.95, groupby=None, columns=None):
+    """
+    confidence intervals for means of each column (and group) of mydata,
+    assuming t-distribution (as cit), all calculated together. Nans are
+    ignored.
+
+    Parameters :
+    ------------
+    mydata : 2D numpy.array or pandas data frame
+    interval : float, 0<interval<1
+        width of confidence interval
+    groupby : None, column name(s) in mydata, or array-like of group labels
+        (see groupedvalues)
+    columns : list or None
+        columns of mydata to use (default: numeric columns)
+
+    Returns :
+    ---------
+    pandas data frame with one row per column (and group), with group
+    columns, 'Column', 'N' (number of non-nan values), 'mean', 'LB', 'UB'.
+    """
+    values, codes, keys = groupedvalues(mydata, groupby, columns)
+    # remove nans
+    valid = np.logical_not(np.isnan(values))
+    values, codes = values[valid], codes[valid]
+    ncodes = len(keys)
+    count = np.bincount(codes, minlength=ncodes)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg = np.bincount(codes, weights=values, minlength=ncodes)/count
+        sqdev = np.bincount(codes, weights=(values - avg[codes])**2,
+                            minlength=ncodes)
+        # Standard error of mean
+        sem = np.sqrt(sqdev/(count - 1))/np.sqrt(count)
+    # t quantiles, once for each number of values
+    lbq = np.full(ncodes, np.nan)
+    ubq = np.full(ncodes, np.nan)
+    for n in np.unique(count[count > 1]):
+        lbq[count == n], ubq[count == n] = tquantiles(n - 1, interval)
+    keys['N'] = count
+    keys['mean'] = avg
+    keys['LB'] = lbq*sem + avg
+    keys['UB'] = ubq*sem + avg
+    return keys
+
+
+def cibtable(mydata, interval=0.95, quantile=0.5, groupby=None,
+             columns=None):
+    """
+    confidence intervals for quantile (default is median) of each column (and
+    group) of mydata given binomial distribution (as cib), all calculated
+    together, with one sort of the data. Nans are ignored.
+
+    Parameters :
+    ------------
+    mydata : 2D numpy.array or pandas data frame
+    interval : float, 0<interval<1
+        width of confidence interval
+    quantile : float, 0<quantile<1
+        quantile of data whose confidence interval should be returned
+    groupby : None, column name(s) in mydata, or array-like of group labels
+        (see groupedvalues)
+    columns : list or None
+        columns of mydata to use (default: numeric columns)
+
+    Returns :
+    ---------
+    pandas data frame with one row per column (and group), with group
+    columns, 'Column', 'N' (number of non-nan values), 'median', 'LB', 'UB'.
+    """
+    values, codes, keys = groupedvalues(mydata, groupby, columns)
+    # remove nans and sort (by code, then value)
+    valid = np.logical_not(np.isnan(values))
+    values, codes = values[valid], codes[valid]
+    order = np.lexsort((values, codes))
+    sortedvals = values[order]
+    ncodes = len(keys)
+    count = np.bincount(codes, minlength=ncodes)
+    starts = np.cumsum(count) - count
+    # Order statistics bounding confidence interval, once for each number of
+    # values
+    lbind = np.full(ncodes, -1)
+    ubind = np.full(ncodes, -1)
+    for n in np.unique(count[count > 0]):
+        lbind[count == n], ubind[count == n] = binomindices(n - 1, interval,
+                                                            quantile)
+    found = count > 0
+    median = np.full(ncodes, np.nan)
+    lb = np.full(ncodes, np.nan)
+    ub = np.full(ncodes, np.nan)
+    median[found] = (sortedvals[starts[found] + (count[found] - 1)//2] +
+                     sortedvals[starts[found] + count[found]//2])/2
+    lb[found] = sortedvals[starts[found] + lbind[found]]
+    ub[found] = sortedvals[starts[found] + ubind[found]]
+    keys['N'] = count
+    keys['median'] = median
+    keys['LB'] = lb
+    keys['UB'] = ub
+    return keys
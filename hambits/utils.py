@@ -66,11 +66,13 @@ def savedictasjson(mydict, savefilename):
             print('File saving error.')
 
 
-def mynewfolder(mydirname, mynewfolder, maxk=10):
+def mynewfolder(mydirname, mynewfolder, maxk=10, ifexists='ask'):
     """
     Create a new directory in path 'mydirname. with name 'mynewfolder'. If
     folder with name 'mynewfolder' already exists in 'mydirname', it asks to
     create a new one, incrementing from 0 to maxk; stops if it reaches maxk.
+    With ifexists other than 'ask', does not ask for user input (for
+    unattended runs).
 
     Parameters:
     ----------
@@ -79,18 +81,33 @@ def mynewfolder(mydirname, mynewfolder, maxk=10):
     mynewfolder : string
         valid folder name
     maxk : int
+    ifexists : string
+        What to do if folder already exists:
+        'ask' : ask user whether to make new folder (incrementing name)
+        'reuse' : use existing folder
+        'increment' : make new folder with first unused incremented name
+        'fail' : do not make folder (returns [])
 
     Returns:
     ---------
     new folder name after incrementing (empty list - [] - if cannot create
     folder.)
     """
+    if ifexists not in ('ask', 'reuse', 'increment', 'fail'):
+        raise ValueError('ifexists must be ask, reuse, increment, or fail')
     if os.path.exists(os.path.join(mydirname, mynewfolder)):
         print(mynewfolder + ' already exists in this directory.')
+        if ifexists == 'reuse':
+            return mynewfolder
+        elif ifexists == 'fail':
+            return []
         for k in range(maxk):
-            response = input(
-                    'Make new folder ' + mynewfolder + str(k) + '? y/n')
-            if response is 'y' or response is 'Y':
+            if ifexists == 'increment':
+                response = 'y'
+            else:
+                response = input(
+                        'Make new folder ' + mynewfolder + str(k) + '? y/n')
+            if response in ('y', 'Y'):
                 if os.path.exists(os.path.join(mydirname, mynewfolder +
                                                str(k))):
                     print(mynewfolder + str(k) +
@@ -100,7 +117,7 @@ def mynewfolder(mydirname, mynewfolder, maxk=10):
                     os.mkdir(os.path.join(mydirname, mynewfolder))
                     break
 
-            elif response is 'n' or response is 'N':
+            elif response in ('n', 'N'):
                 mynewfolder = []
                 break
             else:
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Models for calculating embryo volumes from ImageJ measurements (columns of
+results files, in pixels), for comparing models.
+
+Each model is a function of a data frame (or dict of arrays) and scale
+(length units per pixel), returning volumes (in length units cubed) for all
+rows at once. Models are kept in the registry volumemodels (name: (function,
+columns needed)); add models with registervolumemodel.
+
+Models
+------
+FeretSphere :
+    Sphere with diameter (Feret + MinFeret)/2 (as used for 'Volume' in
+    HamSequence.seqprocess).
+ProlateEllipsoid :
+    Ellipsoid of revolution about major axis of fitted ellipse (Major,
+    Minor, Minor).
+OblateEllipsoid :
+    Ellipsoid of revolution about minor axis of fitted ellipse (Major,
+    Major, Minor).
+AreaSphere :
+    Sphere with same projected area (Area).
+
+Functions
+---------
+spherevolume, ellipsoidvolume : volumes from radii
+registervolumemodel : add model to registry
+volume : volumes from one model
+addvolumes : add column of volumes for each of several models
+
+@author: Michelangelo
+"""
+import numpy as np
+
+# Registry of volume models: {name: (function, list of columns needed)}
+volumemodels = {}
+
+
+def spherevolume(radius):
+    """
+    Volume of sphere(s) with radius (number or numpy array).
+    """
+    return (4*np.pi/3)*radius**3
+
+
+def ellipsoidvolume(a, b, c):
+    """
+    Volume of ellipsoid(s) with semi-axes a, b, c (numbers or numpy arrays).
+    """
+    return (4*np.pi/3)*a*b*c
+
+
+def registervolumemodel(name, function, columns):
+    """
+    Add volume model to registry (replacing any model with same name).
+
+    Parameters :
+    ------------
+    name : string
+        name of model
+    function : function
+        function(data, scale) returning volumes for all rows of data (data
+        frame or dict of numpy arrays) as numpy array or pandas Series
+    columns : list of strings
+        columns of data that function uses
+    """
+    volumemodels[name] = (function, list(columns))
+
+
+registervolumemodel(
+    'FeretSphere',
+    lambda data, scale: spherevolume(
+        scale*(data['Feret'] + data['MinFeret'])/4),
+    ['Feret', 'MinFeret'])
+registervolumemodel(
+    'ProlateEllipsoid',
+    lambda data, scale: ellipsoidvolume(
+        scale*data['Major']/2, scale*data['Minor']/2, scale*data['Minor']/2),
+    ['Major', 'Minor'])
+registervolumemodel(
+    'OblateEllipsoid',
+    lambda data, scale: ellipsoidvolume(
+        scale*data['Major']/2, scale*data['Major']/2, scale*data['Minor']/2),
+    ['Major', 'Minor'])
+registervolumemodel(
+    'AreaSphere',
+    lambda data, scale: spherevolume(scale*np.sqrt(data['Area']/np.pi)),
+    ['Area'])
+
+
+def volume(data, model='FeretSphere', scale=1):
+    """
+    Volumes of all rows of data from one model.
+
+    Parameters :
+    ------------
+    data : pandas data frame (or dict of numpy arrays)
+        must have columns needed by model
+    model : string
+        name of model in volumemodels
+    scale : float
+        length units per pixel
+
+    Returns :
+    ---------
+    pandas Series (or numpy array, for dict of arrays) of volumes
+    """
+    if model not in volumemodels:
+        raise ValueError('Unknown volume model: ' + str(model) +
+                         '; known models: ' + ', '.join(sorted(volumemodels)))
+    function, columns = volumemodels[model]
+    missing = [col for col in columns if col not in data]
+    if missing:
+        raise ValueError('Volume model ' + model + ' needs columns: ' +
+                         ', '.join(missing))
+    return function(data, scale)
+
+
+def addvolumes(data, models=None, scale=1, prefix='Volume_'):
+    """
+    Add column of volumes (named prefix + model name) to data frame for each
+    model.
+
+    Parameters :
+    ------------
+    data : pandas data frame
+    models : list of strings or None
+        names of models; None for all models in volumemodels
+    scale : float
+        length units per pixel
+    prefix : string
+        prefix of column names
+
+    Returns :
+    ---------
+    data (changed in place)
+    """
+    if models is None:
+        models = sorted(volumemodels)
+    for model in models:
+        data[prefix + model] = volume(data, model, scale)
+    return data